@@ -1,30 +1,85 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
 import json
+import hashlib
+import inspect
+from functools import lru_cache
+from urllib.parse import quote
 
+import flask
+from flask_compress import Compress
 import dash
 import dash_html_components as html
 import dash_core_components as dcc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import plotly.graph_objs as go
 
-app = dash.Dash()
+from incident_store import IncidentStore, ensure_store
+from figure_cache import FigureCache, make_backend
+from figure_bundle import (
+    source_hash, render_bundle, write_bundle, ensure_bundle, install_bundle)
+import map_lod
+from state_cube import StateCube
+from metrics import CallbackMetrics
+
+# __name__ so assets/ is found next to this file under gunicorn too
+app = dash.Dash(__name__)
 server = app.server
 
 df_state = pd.read_csv('data/state_clean.csv', index_col='state')
 usa_row = df_state.iloc[0]
 df_state.drop('United States', inplace=True)
-df_gv = pd.read_csv('data/gun_violence_clean.csv', index_col='incident_id')
-df_gv['date'] = pd.to_datetime(df_gv['date'])
+# The choropleth callbacks read df_state's numbers out of this, see
+# state_cube.py
+state_cube = StateCube(df_state)
+# Incidents are memory-mapped from the columnar store instead of read_csv'd,
+# see incident_store.py. The Procfile builds it on the dyno before gunicorn
+# starts, otherwise the first worker here does while the others wait
+ensure_store()
+gv_store = IncidentStore()
 
 mapbox_access_token = os.environ['MAPBOX_ACCESS_TOKEN']
 
-def lookup(state, feature, years=range(2014, 2018)):
-    '''
-    Returns a list of the feature/state requested from df_state
-    '''
-    return [df_state.loc[state, f'{feature}{year}'] for year in years]
+# Compact markers ship only rounded coordinates and incident ids to the
+# incident map, see incident_trace. INCIDENT_MARKERS=full brings back the
+# per-marker hover text
+compact_markers = os.environ.get('INCIDENT_MARKERS', 'compact') != 'full'
+coord_decimals = 4
+# More incidents than this in view and a year gets drawn as clusters
+max_markers = 2000
+# INCIDENT_FILTERING=browser ships each state's incidents to the page once
+# (see state_dataset) and assets/incident_filter.js does the year and
+# Killed/Injured filtering there, so only changing state talks to the server.
+# That mode always draws every marker of the selected state, the Viewport
+# scope and clustering need the server
+client_filtering = os.environ.get('INCIDENT_FILTERING', 'server') == 'browser'
+
+# Callback outputs are memoized per worker. Setting FIGURE_CACHE shares them
+# between workers too, e.g. 'disk:/tmp/gv-figures' or 'redis://localhost:6379'
+figure_cache = FigureCache(
+    maxsize=int(os.environ.get('FIGURE_CACHE_SIZE', 128)),
+    shared=make_backend(os.environ.get('FIGURE_CACHE'),
+                        int(os.environ.get('FIGURE_CACHE_SHARED_SIZE', 4096)))
+)
+
+# Per-callback timings and counts, served on /metrics. Setting
+# CALLBACK_PROFILER to a number of milliseconds also samples what callbacks
+# are doing that often, served on /metrics/profile
+profile_ms = os.environ.get('CALLBACK_PROFILER')
+callback_metrics = CallbackMetrics(
+    profile_interval=float(profile_ms) / 1000 if profile_ms else None)
+
+# Callback responses, the layout and the component bundles go out compressed
+# when they're over COMPRESS_MIN_SIZE bytes. Brotli is used when the client
+# takes it and the installed Flask-Compress has it (1.5+), 1.4 only gzips
+server.config.update(
+    COMPRESS_MIN_SIZE=int(os.environ.get('COMPRESS_MIN_SIZE', 1024)),
+    COMPRESS_LEVEL=6,
+    COMPRESS_ALGORITHM=['br', 'gzip'],
+)
+Compress(server)
 
 def generate_table(dataframe, max_rows=10):
     '''
@@ -41,6 +96,205 @@ def generate_table(dataframe, max_rows=10):
         ]) for i in range(min(len(dataframe), max_rows))]
     )
 
+def point_text(data):
+    '''
+    Returns the text of the first point in a hoverData/clickData dict, None
+    if nothing has been hovered/clicked yet
+    '''
+    if type(data) != dict:
+        return None
+    return data['points'][0]['text']
+
+def hover_id(hoverData):
+    '''
+    Returns the incident id of the hovered marker. Compact markers carry it
+    as customdata, full ones at the start of their hover text. Clusters
+    don't have one, so those return None
+    '''
+    point = hoverData['points'][0]
+    if 'customdata' in point:
+        return int(point['customdata'])
+    text = point.get('text', '')
+    if not text.startswith('ID: '):
+        return None
+    return int(text.split('<br>')[0].split()[1])
+
+def incident_rows(state, year, feature):
+    '''
+    Returns the row positions of a state/year's incidents that pass the
+    incident-radio-feature filter. A state of None means every state
+    '''
+    if state is None:
+        rows = np.concatenate([gv_store.partition(i, year)
+                               for i in gv_store.categories['state']])
+    else:
+        rows = gv_store.partition(state, year)
+    return filter_feature(rows, feature)
+
+def filter_feature(rows, feature):
+    '''
+    Returns the rows that pass the incident-radio-feature filter
+    '''
+    if feature == 'Killed Only':
+        rows = rows[gv_store.column('n_killed')[rows] > 0]
+    elif feature == 'Injured Only':
+        rows = rows[gv_store.column('n_killed')[rows] == 0]
+    return rows
+
+def is_mass(rows):
+    '''
+    Returns a boolean mask of which rows are mass shootings (5+ shot)
+    '''
+    total = gv_store.column('n_killed')[rows] + \
+        gv_store.column('n_injured')[rows]
+    return total >= 5
+
+@lru_cache(maxsize=512)
+def incident_clusters(state, year, feature, level):
+    '''
+    Returns the grid clusters (lat, lon, count) of a state/year's non mass
+    shooting incidents at a zoom level, state None clusters the whole
+    country. Each one is built the first time it's needed and kept after
+    that
+    '''
+    rows = incident_rows(state, year, feature)
+    rows = rows[~is_mass(rows)]
+    return map_lod.grid_clusters(gv_store.column('latitude')[rows],
+                                 gv_store.column('longitude')[rows], level)
+
+def cluster_trace(clusters, bounds, marker, **kwargs):
+    '''
+    Returns a Scattermapbox trace of the clusters inside bounds, marker
+    sizes grow with the number of incidents in each cluster
+    '''
+    lat, lon, count = clusters
+    keep = map_lod.in_bounds(lat, lon, bounds)
+    count = count[keep]
+    marker = dict(marker, size=map_lod.cluster_sizes(count))
+    return go.Scattermapbox(
+        lat=lat[keep].round(coord_decimals),
+        lon=lon[keep].round(coord_decimals),
+        text=[f'{n} incidents' for n in count],
+        hoverinfo='text',
+        mode='markers',
+        marker=marker,
+        **kwargs
+    )
+
+# Everything the Info and Notes boxes show about an incident
+detail_columns = ['date', 'n_killed', 'n_injured', 'address',
+                  'location_description', 'gun_type', 'participant_age',
+                  'incident_url', 'notes']
+
+@lru_cache(maxsize=1024)
+def incident_details(incident_id):
+    '''
+    Returns a json friendly dict of detail_columns for one incident, raises
+    KeyError if there's no such incident.
+
+    incident_info and incident_notes both fire on the same hover, the cache
+    means the store only gets read once between them
+    '''
+    details = gv_store.record(incident_id, detail_columns)
+    details['incident_id'] = incident_id
+    details['date'] = str(details['date'].date())
+    return details
+
+def incident_trace(df, **kwargs):
+    '''
+    Returns a Scattermapbox trace of the incidents in df, kwargs are passed
+    on to the trace.
+
+    Compact markers are just lat/lon rounded to coord_decimals (~11m) and the
+    incident id as customdata. There's no hover tooltip, the Info box shows
+    the details of whatever marker is hovered. Otherwise every marker gets
+    its id, address and location description as hover text
+    '''
+    if compact_markers:
+        return go.Scattermapbox(
+            lat=df['latitude'].round(coord_decimals),
+            lon=df['longitude'].round(coord_decimals),
+            customdata=df.index.values,
+            hoverinfo='none',
+            mode='markers',
+            **kwargs
+        )
+
+    text = 'ID: ' + df.index.astype(str) + '<br>' + \
+        df['address'].fillna('') +  '<br>' + \
+        df['location_description'].fillna('')
+    return go.Scattermapbox(
+        lat=df['latitude'],
+        lon=df['longitude'],
+        hoverinfo='text',
+        text=text,
+        mode='markers',
+        **kwargs
+    )
+
+def state_center(state):
+    '''
+    Returns the (lat, lon) of a state's capital, where the incident map starts
+    '''
+    lat, lon = [float(i) for i in df_state.loc[state, 'center'].split(',')]
+    return lat, lon
+
+def map_layout(view):
+    '''
+    Returns the incident map's layout at a map_lod.viewport view
+    '''
+    return go.Layout(
+        margin={'l': 0, 'b': 0, 't': 0, 'r': 0},
+        height=450,
+        autosize=True,
+        mapbox={
+            'accesstoken': mapbox_access_token,
+            'center': view['center'],
+            'zoom': view['zoom'],
+            'style': 'light'
+        }
+    )
+
+@lru_cache(maxsize=64)
+def state_dataset(state):
+    '''
+    Returns the (json body, etag) of everything browser side filtering needs
+    to draw a state's incidents: the capital to start at and one array per
+    column of incident id, lat/lon (rounded like compact markers), year (as
+    an offset from first_year) and flags (1 = someone was killed, 2 = mass
+    shooting). Incidents without coordinates are left out, they can't be
+    drawn anyway.
+
+    The etag is a hash of the body, so it only changes when the store does
+    '''
+    rows = np.concatenate([
+        gv_store.partition(state, year)
+        for year in range(gv_store.first_year, gv_store.last_year + 1)
+    ])
+    lat = gv_store.column('latitude')[rows]
+    lon = gv_store.column('longitude')[rows]
+    located = ~(np.isnan(lat) | np.isnan(lon))
+    rows, lat, lon = rows[located], lat[located], lon[located]
+    flags = (gv_store.column('n_killed')[rows] > 0).astype(np.int8) | \
+        (is_mass(rows).astype(np.int8) << 1)
+    center_lat, center_lon = state_center(state)
+
+    dataset = {
+        'state': state,
+        'center': {'lat': center_lat, 'lon': center_lon},
+        'zoom': 8.5,
+        'first_year': gv_store.first_year,
+        'id': gv_store.column('incident_id')[rows].tolist(),
+        'lat': lat.round(coord_decimals).tolist(),
+        'lon': lon.round(coord_decimals).tolist(),
+        'year': (gv_store.column('year')[rows] -
+                 gv_store.first_year).tolist(),
+        'flags': flags.tolist(),
+    }
+    body = json.dumps(dataset, separators=(',', ':'))
+    etag = hashlib.blake2b(body.encode('utf-8'), digest_size=16).hexdigest()
+    return body, etag
+
 def clr_check(val, default_color, mass_color='black', threshold=10):
     '''
     For use in the individual incident plot.
@@ -150,7 +404,24 @@ app.layout = html.Div([
                         labelStyle={'display': 'inline-block'}
                     ),
                 style={'width': '35%', 'display': 'inline-block'},
-                )
+                ),
+                # Scope Radio
+                html.Div(
+                    dcc.RadioItems(
+                        id='incident-radio-scope',
+                        options=[
+                            {'label': 'Selected State', 'value': 'State'},
+                            {'label': 'Everything In View',
+                             'value': 'Viewport'},
+                        ],
+                        value='State',
+                        labelStyle={'display': 'inline-block'}
+                    ),
+                style={
+                    'width': '100%',
+                    'textAlign': 'center',
+                    'display': 'none' if client_filtering else 'block',
+                })
             ], style={
                 'borderStyle': 'solid',
                 'borderColor': 'black',
@@ -161,7 +432,19 @@ app.layout = html.Div([
                 id='incident-plot',
                 config={'displayModeBar': False},
                 style={'width': '100%', 'display': 'inline-block'},
-            )
+                # Browser side filtering draws on top of this, the server
+                # callback replaces it on load otherwise
+                figure={
+                    'data': [],
+                    'layout': map_layout(
+                        map_lod.viewport(*state_center('Arizona'), 8.5))
+                },
+            ),
+            # Where assets/incident_filter.js gets the selected state's
+            # incidents from, only filled in with INCIDENT_FILTERING=browser
+            html.Div(id='incident-data-url', style={'display': 'none'}),
+            # The view the user panned the map to, see incident_map_view
+            html.Div(id='incident-map-view', style={'display': 'none'})
         ], style={'width': '70%', 'display': 'inline-block'}),
         # # Info Boxes
         html.Div([
@@ -214,20 +497,13 @@ def choropleth_plot(year, metric):
     [Input('choropleth-slider-year', 'value'),
     Input('choropleth-dropdown-feature', 'value'),
     Input('choropleth-radio-metric', 'value')])
+@figure_cache.memoize()
 def choropleth_plot(year, feature, metric):
     '''
     Returns a plotly figure for the main state choropleth
     '''
-    # Checks type of feature
-    if feature != 'Total':
-        z = df_state[feature.lower() + str(year)]
-    else:
-        z = df_state['killed' + str(year)] + df_state['injured' + str(year)]
-
-    # Checks metric
+    z = state_cube.year(year, feature, metric)
     if metric == 'Per 100,000':
-        pop = df_state['popestimate' + str(year)]
-        z = z / (pop / 100000)
         z = z.round(2)
 
     # Color Scale
@@ -266,6 +542,7 @@ def choropleth_plot(year, feature, metric):
         }
     )]
 
+    callback_metrics.count(rows=len(z), traces=len(data))
     layout = go.Layout(
         margin={'l': 10, 'b': 20, 't': 0, 'r': 10},
         geo = dict(scope='usa', projection={'type': 'albers usa'})
@@ -279,24 +556,15 @@ def choropleth_plot(year, feature, metric):
     Input('choropleth-radio-metric', 'value'),
     Input('choropleth-plot', 'hoverData'),
     Input('choropleth-plot', 'clickData')])
+@figure_cache.memoize(key=lambda feature, metric, hoverData, clickData:
+    (feature, metric, point_text(hoverData), point_text(clickData)))
 def choropleth_trend(feature, metric, hoverData, clickData):
     '''
     This function returns the plotly figure for the state's trend plot
     '''
     hover_state = hoverData['points'][0]['text']
-
-    # Checks if total
-    if feature != 'Total':
-        y = lookup(hover_state, feature.lower())
-    else:
-        killed = np.array(lookup(hover_state, 'killed'))
-        injured = np.array(lookup(hover_state, 'injured'))
-        y = killed + injured
-    # Check for Population scaling
-    if metric == 'Per 100,000':
-        pop = np.array(lookup(hover_state, 'popestimate'))
-        y = np.array(y) / (pop / 100000)
-    max_y = max(y)
+    y = state_cube.trend(hover_state, feature, metric)
+    max_y = y.max()
 
     # Main trace
     data = [go.Scatter(x=list(range(2014, 2018)), y=y, name=hover_state)]
@@ -304,20 +572,9 @@ def choropleth_trend(feature, metric, hoverData, clickData):
     # Checks for clicked on state
     if type(clickData) == dict:
         click_state = clickData['points'][0]['text']
-        # Checks if total
-        if feature != 'Total':
-            y = lookup(click_state, feature.lower())
-        else:
-            killed = np.array(lookup(click_state, 'killed'))
-            injured = np.array(lookup(click_state, 'injured'))
-            y = killed + injured
-        # Check for Population scaling
-        if metric == 'Per 100,000':
-            pop = np.array(lookup(click_state, 'popestimate'))
-            y = np.array(y) / (pop / 100000)
+        y = state_cube.trend(click_state, feature, metric)
         # Check for a new larger y
-        if max_y < max(y):
-            max_y = max(y)
+        max_y = max(max_y, y.max())
         # Data Trace
         trace = go.Scatter(
             x=list(range(2014, 2018)),
@@ -327,6 +584,7 @@ def choropleth_trend(feature, metric, hoverData, clickData):
         )
         data.append(trace)
 
+    callback_metrics.count(rows=len(data), traces=len(data))
     # Rescales yaxis
     if max_y > 7:
         yaxis_range = [0, max_y + 1]
@@ -348,20 +606,15 @@ def choropleth_trend(feature, metric, hoverData, clickData):
     Output('choropleth-totals', 'children'),
     [Input('choropleth-plot', 'hoverData'),
     Input('choropleth-slider-year', 'value')])
+@figure_cache.memoize(key=lambda hoverData, year: (point_text(hoverData), year))
 def choropleth_totals(hoverData, year):
     '''
     This function will return the totals info for the hover-on state
     '''
     hover_state = hoverData['points'][0]['text']
 
-    row = df_state.loc[hover_state]
-    killed = row[f'killed{year}']
-    injured = row[f'injured{year}']
-    total = killed + injured
-    pop = row[f'popestimate{year}']
-
-    raw = [killed, injured, total]
-    per = np.round(np.array(raw) / (pop / 100000), 2)
+    raw, per = state_cube.totals(hover_state, year)
+    per = per.round(2)
     idxs = ['Killed' , 'Injured', 'Total']
 
     df = pd.DataFrame(data={' ': idxs, 'Raw': raw, 'Per 100,000': per})
@@ -370,74 +623,94 @@ def choropleth_totals(hoverData, year):
     table.style = {'height': 50, 'width': '50%', 'overflowY': 'scroll'}
     return table
 
-@app.callback(
-    Output('incident-plot', 'figure'),
-    [Input('incident-checklist-year', 'values'),
-    Input('incident-dropdown-state', 'value'),
-    Input('incident-radio-feature', 'value')])
-def incident_plot(years, state, feature):
+def panned_view(state, map_view):
+    '''
+    Returns the (lat, lon, zoom) the user panned/zoomed the map to out of
+    incident_map_view's json, None if they haven't since picking the state
+    '''
+    if not map_view:
+        return None
+    map_view = json.loads(map_view)
+    if map_view['state'] != state or map_view['view'] is None:
+        return None
+    return tuple(map_view['view'])
+
+@figure_cache.memoize(key=lambda years, state, feature, scope, map_view:
+    (sorted(years), state, feature, scope, panned_view(state, map_view)))
+def incident_plot(years, state, feature, scope, map_view):
     '''
     Returns figure for the main Individual Incidents Mapbox
+
+    The map follows wherever the user pans/zooms to (map_view, see
+    incident_map_view), even outside the state. When more than
+    max_markers of a year's incidents are in view they're drawn as grid
+    clusters instead of individual markers. Mass shootings are always drawn
+    individually
+
+    The 'State' scope shows the selected state's incidents. 'Viewport' shows
+    everything inside the current view no matter the state, pulled from the
+    store's spatial index, the selected state only picks where to start
     '''
     years.sort()
 
-    df = df_gv.copy()
-    df = df[df['state']==state]
+    columns = ['n_killed', 'n_injured', 'latitude', 'longitude']
+    if not compact_markers:
+        columns += ['address', 'location_description']
+    latitude = gv_store.column('latitude')
+    longitude = gv_store.column('longitude')
 
     colors = ['red', 'orange', 'green', 'blue', 'purple']
-    center = df_state.loc[state, 'center']
-    lat, lon = [float(i) for i in center.split(',')]
-    center = {'lat': lat, 'lon': lon}
+    # New states start at the capital
+    view = panned_view(state, map_view) or (*state_center(state), 8.5)
+    view = map_lod.viewport(*view)
+    if scope == 'Viewport':
+        # One index query for the whole view, split up by year below
+        view_rows = gv_store.within(view['bounds'])
+        view_years = gv_store.column('year')[view_rows]
 
 
     data = []
+    scanned = 0
     # Make a trace for each year user is interested in
     for year in years:
-        df_year = df[df['date'].apply(lambda x: x.year==year)]
-        # Check incident filter
-        if feature != 'Show All':
-            feature = feature.split()[0].lower()
-            if feature == 'killed':
-                df_year = df_year[df_year['n_killed'] > 0]
-            elif feature == 'injured':
-                df_year = df_year[df_year['n_killed'] == 0]
+        if scope == 'Viewport':
+            rows = filter_feature(view_rows[view_years == year], feature)
+        else:
+            rows = incident_rows(state, year, feature)
 
         # Partition out mass shootings
-        print(len(df_year))
-        df_year['total'] = df_year['n_killed'] + df_year['n_injured']
-        df_mass = df_year[df_year['total'] >= 5]
-        df_year = df_year[df_year['total'] < 5]
-        print(len(df_year))
-        print(len(df_mass))
+        mass = is_mass(rows)
+        rows, mass_rows = rows[~mass], rows[mass]
+        in_view = rows[map_lod.in_bounds(latitude[rows], longitude[rows],
+                                         view['bounds'])]
+        scanned += len(rows) + len(mass_rows)
 
         # Main Traces
-        text = 'ID: ' + df_year.index.astype(str) + '<br>' + \
-            df_year['address'].fillna('') +  '<br>' + \
-            df_year['location_description'].fillna('')
-        data.append(go.Scattermapbox(
-            lat=df_year['latitude'],
-            lon=df_year['longitude'],
-            hoverinfo='text',
-            text=text,
-            mode='markers',
-            name=year,
-            marker={
-                'size': 7,
-                'color': colors.pop(0),
-                'opacity': 0.6,
-            }
-        ))
+        color = colors.pop(0)
+        if len(in_view) > max_markers:
+            clusters = incident_clusters(
+                state if scope == 'State' else None, year, feature,
+                view['level'])
+            data.append(cluster_trace(
+                clusters,
+                view['bounds'],
+                name=year,
+                marker={'color': color, 'opacity': 0.6}
+            ))
+        else:
+            data.append(incident_trace(
+                gv_store.frame(in_view, columns),
+                name=year,
+                marker={
+                    'size': 7,
+                    'color': color,
+                    'opacity': 0.6,
+                }
+            ))
 
         # Mass Traces
-        text = 'ID: ' + df_mass.index.astype(str) + '<br>' + \
-            df_mass['address'].fillna('') +  '<br>' + \
-            df_mass['location_description'].fillna('')
-        data.append(go.Scattermapbox(
-            lat=df_mass['latitude'],
-            lon=df_mass['longitude'],
-            hoverinfo='text',
-            text=text,
-            mode='markers',
+        data.append(incident_trace(
+            gv_store.frame(mass_rows, columns),
             marker={
                 'size': 9,
                 'color': 'black',
@@ -447,19 +720,52 @@ def incident_plot(years, state, feature):
         ))
 
 
-    layout = go.Layout(
-        margin={'l': 0, 'b': 0, 't': 0, 'r': 0},
-        height=450,
-        autosize=True,
-        mapbox={
-            'accesstoken': mapbox_access_token,
-            'center':center,
-            'zoom': 8.5,
-            'style': 'light'
-        }
-    )
-
-    return {'data': data, 'layout': layout}
+    callback_metrics.count(rows=scanned, traces=len(data))
+    return {'data': data, 'layout': map_layout(view)}
+
+# With browser side filtering the page draws the incident map itself, the
+# only thing it asks the server for is where the selected state's data is
+if client_filtering:
+    @app.callback(
+        Output('incident-data-url', 'children'),
+        [Input('incident-dropdown-state', 'value')])
+    def incident_data_url(state):
+        '''
+        Returns the url of the state's dataset. It carries the etag, so a
+        browser that's seen the state before doesn't have to ask again
+        '''
+        _, etag = state_dataset(state)
+        return f'/incidents/{quote(state)}?v={etag}'
+else:
+    @app.callback(
+        Output('incident-map-view', 'children'),
+        [Input('incident-dropdown-state', 'value'),
+        Input('incident-plot', 'relayoutData')],
+        [State('incident-map-view', 'children')])
+    def incident_map_view(state, relayoutData, previous):
+        '''
+        Returns json of the state picked and the view the user panned/zoomed
+        the map to in it. There's no callback_context in this Dash to tell
+        which input changed, so a state different from the previous one
+        means the dropdown changed and the view starts over at the capital.
+        relayoutData still holds the old state's view then
+        '''
+        previous = json.loads(previous) if previous else {}
+        view = map_lod.view_key(relayoutData)
+        if previous.get('state') != state:
+            view = None
+        elif view is None:
+            # Autosize and the like, stay where the map was
+            view = previous.get('view')
+        return json.dumps({'state': state, 'view': view})
+
+    app.callback(
+        Output('incident-plot', 'figure'),
+        [Input('incident-checklist-year', 'values'),
+        Input('incident-dropdown-state', 'value'),
+        Input('incident-radio-feature', 'value'),
+        Input('incident-radio-scope', 'value'),
+        Input('incident-map-view', 'children')])(incident_plot)
 
 @app.callback(
     Output('incident-info', 'value'),
@@ -473,15 +779,21 @@ def incident_info(hoverData):
     # check for initial hover
     if type(hoverData) != dict:
         return "Hover over a marker to get incident info"
-    else:
-        hovertext = hoverData['points'][0]['text']
-        id =int(hovertext.split('<br>')[0].split()[1])
-        row = df_gv.loc[id]
+    # clusters don't have an incident to show
+    incident_id = hover_id(hoverData)
+    if incident_id is None:
+        return "Hover over a marker to get incident info"
+    row = incident_details(incident_id)
 
     # date, killed, injured, participants, victims
-    text = 'Date:\t' + str(row['date'])[:-9] + '\n' + \
+    text = 'Date:\t' + row['date'] + '\n' + \
            'Killed:\t' + str(row['n_killed']) + '\n' + \
            'Injured:\t' + str(row['n_injured']) + '\n\n'
+    # where
+    if type(row['address']) == str:
+        text += 'Address:\t\t' + row['address'] + '\n'
+    if type(row['location_description']) == str:
+        text += 'Location:\t\t' + row['location_description'] + '\n'
     # gun type
     if type(row['gun_type']) == str:
         text += 'Gun Type:\t\t' + row['gun_type'] + '\n'
@@ -512,16 +824,151 @@ def incident_notes(hoverData):
     '''
     if type(hoverData) != dict:
         return "Hover over a marker to read notes on that incident"
-    else:
-        hovertext = hoverData['points'][0]['text']
-        id =int(hovertext.split('<br>')[0].split()[1])
-        row = df_gv.loc[id]
+    # clusters don't have an incident to show
+    incident_id = hover_id(hoverData)
+    if incident_id is None:
+        return "Hover over a marker to read notes on that incident"
+    row = incident_details(incident_id)
 
     notes = row['notes']
     if type(notes) != str:
         return 'No notes for this incident'
     return notes
 
+@server.route('/metrics')
+def metrics_text():
+    '''
+    This worker's callback metrics for Prometheus to scrape
+    '''
+    return flask.Response(callback_metrics.prometheus(figure_cache.stats()),
+                          mimetype='text/plain; version=0.0.4')
+
+@server.route('/metrics/profile')
+def metrics_profile():
+    '''
+    The CALLBACK_PROFILER samples as folded stacks, 404 if it's off
+    '''
+    if not callback_metrics.profile_interval:
+        flask.abort(404)
+    return flask.Response(callback_metrics.folded_stacks(),
+                          mimetype='text/plain')
+
+@server.route('/incident/<int:incident_id>')
+def incident_json(incident_id):
+    '''
+    Returns the same details the Info/Notes boxes use as json
+    '''
+    try:
+        return flask.jsonify(incident_details(incident_id))
+    except KeyError:
+        flask.abort(404)
+
+@server.route('/incidents/<state>')
+def incident_dataset(state):
+    '''
+    Serves a state's state_dataset for browser side filtering. Asked for with
+    the current etag as ?v= it's cached for good, otherwise the browser has
+    to check the etag each time and gets a 304 if nothing changed
+    '''
+    if state not in df_state.index:
+        flask.abort(404)
+    body, etag = state_dataset(state)
+    response = flask.Response(body, mimetype='application/json')
+    if flask.request.args.get('v') == etag:
+        return conditional(response, etag, max_age=365 * 24 * 3600)
+    return conditional(response, etag)
+
+def conditional(response, etag=None, max_age=None):
+    '''
+    Tags a response with an etag, a hash of its body unless one's given.
+    With max_age browsers keep it that many seconds, otherwise they have to
+    check it's still current every time.
+
+    Returns a bodyless 304 instead if the browser's If-None-Match already
+    has the etag. Newer Flask-Compress versions send etags back with the
+    compression tacked on ("etag:gzip"), those count too
+    '''
+    if etag is None:
+        etag = hashlib.blake2b(response.get_data(),
+                               digest_size=16).hexdigest()
+    if etag in {tag.split(':')[0]
+                for tag in flask.request.if_none_match.as_set()}:
+        response = flask.Response(status=304)
+    response.set_etag(etag)
+    if max_age is None:
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    return response
+
+# Dash's responses that are the same for every request until the next deploy
+static_paths = {
+    app.config['routes_pathname_prefix'],
+    f'{app.config["routes_pathname_prefix"]}_dash-layout',
+    f'{app.config["routes_pathname_prefix"]}_dash-dependencies',
+}
+
+@server.after_request
+def revalidate_static(response):
+    '''
+    Lets browsers revalidate the page, layout and callback list instead of
+    downloading them again. Registered after Compress so it runs first and
+    the etag is of the uncompressed body.
+
+    Callback responses can't get the same treatment, dash-renderer POSTs
+    them and a POST never gets a 304. The choropleth figures are served out
+    of the precomputed bundle and compressed instead
+    '''
+    if flask.request.method == 'GET' and response.status_code == 200 and \
+            flask.request.path in static_paths:
+        return conditional(response)
+    return response
+
+# choropleth_plot and choropleth_totals only have a few hundred possible
+# outputs between them, so they're all rendered once and served straight
+# from the bundle. The first worker to start renders it (or
+# `python app.py --precompute` does ahead of time), it's rendered again
+# whenever state_clean.csv or the code drawing the figures changes
+bundle_path = 'data/figure_bundle.json'
+bundle_source = source_hash('data/state_clean.csv', __file__,
+                            inspect.getfile(StateCube))
+bundle_keys = {
+    'choropleth-plot.figure':
+        lambda year, feature, metric: (year, feature, metric),
+    'choropleth-totals.children':
+        lambda hoverData, year: (point_text(hoverData), year),
+}
+
+def bundle_calls():
+    '''
+    Returns the args of every possible choropleth_plot/choropleth_totals call
+    '''
+    years = range(2014, 2018)
+    return {
+        'choropleth-plot.figure': [
+            (year, feature, metric) for year in years
+            for feature in ['Killed', 'Injured', 'Total']
+            for metric in ['Raw', 'Per 100,000']
+        ],
+        'choropleth-totals.children': [
+            ({'points': [{'text': state}]}, year) for year in years
+            for state in df_state.index
+        ],
+    }
+
+if __name__ == '__main__' and '--precompute' in sys.argv:
+    bundle = render_bundle(app, bundle_calls(), bundle_keys)
+    write_bundle(bundle, bundle_path, bundle_source)
+    print(f'Wrote {sum(len(i) for i in bundle.values())} responses to '
+          f'{bundle_path}')
+    sys.exit()
+
+ensure_bundle(app, bundle_path, bundle_calls(), bundle_keys, bundle_source)
+install_bundle(app, bundle_path, bundle_keys, bundle_source)
+# After the bundle, so bundled responses get timed too
+callback_metrics.instrument(app)
+
 
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -0,0 +1,149 @@
+// Browser side filtering for the incident map, see INCIDENT_FILTERING in
+// app.py. The server puts the selected state's dataset url in
+// #incident-data-url, this fetches it once and redraws #incident-plot from it
+// whenever the year checklist or Killed/Injured radio change. None of that
+// goes back to the server. Without INCIDENT_FILTERING=browser the url div
+// stays empty and this does nothing
+(function() {
+    var colors = ['red', 'orange', 'green', 'blue', 'purple'];
+    // The dataset being drawn and the url it came from
+    var dataset = null;
+    var datasetUrl = null;
+    // The url of the last fetch, older responses get thrown away
+    var wantedUrl = null;
+    var drawnUrl = null;
+    var revision = 0;
+
+    function checkedLabels(id) {
+        // dcc.Checklist/RadioItems inputs have no value attribute, the
+        // labels here are the same as the values
+        var labels = document.querySelectorAll('#' + id + ' label');
+        var checked = [];
+        for (var i = 0; i < labels.length; i++) {
+            var input = labels[i].querySelector('input');
+            if (input && input.checked) {
+                checked.push(labels[i].textContent.trim());
+            }
+        }
+        return checked;
+    }
+
+    function markers(name, marker, showlegend) {
+        // Same as the server's compact incident_trace
+        return {
+            type: 'scattermapbox',
+            mode: 'markers',
+            hoverinfo: 'none',
+            name: name,
+            lat: [],
+            lon: [],
+            customdata: [],
+            marker: marker,
+            showlegend: showlegend
+        };
+    }
+
+    function traces(years, feature) {
+        var main = {};
+        var mass = {};
+        years.forEach(function(year, i) {
+            main[year] = markers(year, {
+                size: 7, color: colors[i], opacity: 0.6
+            }, true);
+            mass[year] = markers(year, {
+                size: 9, color: 'black', opacity: 0.9
+            }, false);
+        });
+
+        var d = dataset;
+        for (var row = 0; row < d.id.length; row++) {
+            var year = d.first_year + d.year[row];
+            if (!(year in main)) {
+                continue;
+            }
+            var killed = d.flags[row] & 1;
+            if ((feature === 'Killed Only' && !killed) ||
+                    (feature === 'Injured Only' && killed)) {
+                continue;
+            }
+            var trace = d.flags[row] & 2 ? mass[year] : main[year];
+            trace.lat.push(d.lat[row]);
+            trace.lon.push(d.lon[row]);
+            trace.customdata.push(d.id[row]);
+        }
+
+        var data = [];
+        years.forEach(function(year) {
+            data.push(main[year], mass[year]);
+        });
+        return data;
+    }
+
+    function draw() {
+        var gd = document.getElementById('incident-plot');
+        // Wait for dcc.Graph to have drawn its first (empty) figure
+        if (!dataset || !gd || !gd._fullLayout || !window.Plotly) {
+            return;
+        }
+        var years = checkedLabels('incident-checklist-year').map(Number);
+        years.sort(function(a, b) { return a - b; });
+        years = years.slice(0, colors.length);
+        var feature = checkedLabels('incident-radio-feature')[0] || 'Show All';
+
+        var layout = Object.assign({}, gd.layout);
+        // A new state starts at its capital, otherwise stay where the user
+        // panned to
+        if (drawnUrl !== datasetUrl) {
+            layout.mapbox = Object.assign({}, gd.layout.mapbox, {
+                center: dataset.center,
+                zoom: dataset.zoom
+            });
+        }
+        layout.datarevision = ++revision;
+        drawnUrl = datasetUrl;
+        Plotly.react(gd, traces(years, feature), layout);
+    }
+
+    function watchUrl() {
+        var div = document.getElementById('incident-data-url');
+        var url = div ? div.textContent : '';
+        if (url && url !== wantedUrl) {
+            wantedUrl = url;
+            // The url carries the etag, the browser cache handles repeats
+            fetch(url, {credentials: 'same-origin'})
+                .then(function(response) { return response.json(); })
+                .then(function(d) {
+                    if (url !== wantedUrl) {
+                        return;
+                    }
+                    dataset = d;
+                    datasetUrl = url;
+                    draw();
+                });
+        } else if (dataset && drawnUrl !== datasetUrl) {
+            // The dataset beat the graph's first draw
+            draw();
+        }
+    }
+
+    document.addEventListener('change', function(event) {
+        var target = event.target;
+        if (target.closest('#incident-checklist-year') ||
+                target.closest('#incident-radio-feature')) {
+            // Let dcc's onChange finish re-rendering the inputs first
+            setTimeout(draw, 0);
+        }
+    });
+
+    function start() {
+        new MutationObserver(watchUrl).observe(document.body, {
+            childList: true, subtree: true, characterData: true
+        });
+        watchUrl();
+    }
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', start);
+    } else {
+        start();
+    }
+})();
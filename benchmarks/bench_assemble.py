@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# The scraper modules import each other as siblings
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'scraper'))
+from index_assemble import assemble, shards
+
+def concat_assembler(paths):
+    '''
+    The old assembler, concat inside the loop
+    '''
+    df = pd.read_csv(paths[0])
+    for path in paths[1:]:
+        df = pd.concat([df, pd.read_csv(path)])
+    return df
+
+def measure(func, *args):
+    '''
+    Returns the result, the seconds it took and the peak MB allocated. Time
+    and memory are separate runs, tracing the allocations slows it down
+    '''
+    start = time.time()
+    result = func(*args)
+    seconds = time.time() - start
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 1e6
+
+def write_shards(path, n_shards, per_shard, upper, seed=0):
+    '''
+    Shards of random ids, overlapping so there's duplicates to drop
+    '''
+    rng = np.random.default_rng(seed)
+    for i in range(n_shards):
+        ids = rng.integers(1, upper, per_shard)
+        pd.DataFrame({'ids': ids}).to_csv(
+            os.path.join(path, f'shard_{i:05}.csv'), index=False)
+
+if __name__ == '__main__':
+    per_shard = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    upper = 1500000
+    for n_shards in [100, 1000, 5000]:
+        with tempfile.TemporaryDirectory() as tmp:
+            write_shards(tmp, n_shards, per_shard, upper)
+            paths = shards(tmp)
+            out = os.path.join(tmp, 'assembled.csv')
+            n_ids, new_seconds, new_mb = measure(assemble, paths, out)
+            df, old_seconds, old_mb = measure(concat_assembler, paths)
+            assert n_ids == df['ids'].nunique()
+            assert (pd.read_csv(out)['ids'].values ==
+                    np.sort(df['ids'].unique())).all()
+        print(f'{n_shards:>5} shards x {per_shard} ids: '
+              f'concat loop {old_seconds:.2f}s {old_mb:.1f} MB peak, '
+              f'streaming {new_seconds:.2f}s {new_mb:.1f} MB peak')
@@ -0,0 +1,336 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'benchmarks'))
+import clean
+import geocode
+from bench_clean import write_raw, write_population
+
+def write_data(path, n_rows, seed=0):
+    '''
+    Writes a made up data/gun_violence_clean.csv and data/state_clean.csv
+    under path. Capitals come from the stub geocoder and incidents are
+    scattered around them, a few big states get a lot more than the rest
+    so there's heavy maps to draw like the real data has
+    '''
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(path, 'data'))
+    raw_path = os.path.join(path, 'raw.csv')
+    population_path = os.path.join(path, 'population.csv')
+    write_raw(raw_path, n_rows, seed)
+    write_population(population_path)
+
+    resolver = geocode.Resolver(
+        geocode.StubGeocoder(),
+        geocode.GeocodeCache(os.path.join(path, 'geocode.db')), rate=None)
+    states = [state for state in clean.us_state_abbrev
+              if state != 'United States']
+    centers = dict(zip(states, clean.state_centers(states, resolver)))
+
+    df = pd.read_csv(raw_path)
+    weights = np.ones(len(states))
+    for state, weight in [('Illinois', 12), ('California', 10),
+                          ('Texas', 8), ('Florida', 8)]:
+        weights[states.index(state)] = weight
+    df['state'] = rng.choice(states, len(df), p=weights / weights.sum())
+    center = df['state'].map(centers).str.split(',', expand=True).astype(float)
+    df['latitude'] = (center[0] + rng.normal(0, 0.6, len(df))).round(4)
+    df['longitude'] = (center[1] + rng.normal(0, 0.6, len(df))).round(4)
+    df.to_csv(raw_path, index=False)
+
+    totals, _ = clean.update([(raw_path, 'kaggle')],
+                             os.path.join(path, clean.CLEAN_PATH), workers=1)
+    clean.clean_states(totals, population_path, resolver=resolver).to_csv(
+        os.path.join(path, clean.STATE_PATH), index=False)
+
+def reset_peak_rss():
+    '''
+    Resets the kernel's high water mark of this process' RSS, so peak_rss
+    is the peak since. Linux only, elsewhere peak_rss is the peak of the
+    whole run
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def peak_rss():
+    '''
+    Returns the peak RSS in MB, see reset_peak_rss
+    '''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Page:
+    '''
+    Does what dash-renderer does in the browser. Keeps the value of every
+    prop the callbacks use, starting from app.layout, and when some of them
+    change POSTs to /_dash-update-component for every callback that takes
+    them as an input. Outputs are fed on to any callback that uses them.
+
+    Each POST's seconds, response bytes and peak RSS get recorded under
+    the callback's output id
+    '''
+    def __init__(self, app, client):
+        self.client = client
+        self.callbacks = {
+            output: (entry['inputs'], entry['state'])
+            for output, entry in app.callback_map.items()
+        }
+        self.values = {}
+        components = {getattr(c, 'id', None): c
+                       for c in app.layout.traverse()}
+        for inputs, state in self.callbacks.values():
+            for prop in inputs + state:
+                self.values[f'{prop["id"]}.{prop["property"]}'] = getattr(
+                    components[prop['id']], prop['property'], None)
+        self.seconds = defaultdict(list)
+        self.bytes = defaultdict(list)
+        self.rss = defaultdict(float)
+
+    def load(self):
+        '''
+        The renderer calls every callback once when the page loads
+        '''
+        for output in self.callbacks:
+            self.call(output)
+
+    def set(self, changes):
+        '''
+        Sets {'id.property': value} like a user interaction would
+        '''
+        self.values.update(changes)
+        self.fire(changes)
+
+    def fire(self, changed):
+        firing = [output for output, (inputs, _) in self.callbacks.items()
+                  if any(f'{i["id"]}.{i["property"]}' in changed
+                         for i in inputs)]
+        for output in firing:
+            # Like the renderer, a callback with an input another one of
+            # these is about to update waits for it
+            inputs, _ = self.callbacks[output]
+            if not any(f'{i["id"]}.{i["property"]}' in firing
+                       for i in inputs):
+                self.call(output)
+
+    def call(self, output):
+        inputs, state = self.callbacks[output]
+        component_id, prop = output.rsplit('.', 1)
+        body = json.dumps({
+            'output': {'id': component_id, 'property': prop},
+            'inputs': [dict(i, value=self.values[f'{i["id"]}.{i["property"]}'])
+                       for i in inputs],
+            'state': [dict(s, value=self.values[f'{s["id"]}.{s["property"]}'])
+                      for s in state],
+        })
+        reset_peak_rss()
+        start = time.perf_counter()
+        response = self.client.post('/_dash-update-component', data=body,
+                                    content_type='application/json')
+        data = response.get_data()
+        self.seconds[output].append(time.perf_counter() - start)
+        self.bytes[output].append(len(data))
+        self.rss[output] = max(self.rss[output], peak_rss())
+        if response.status_code != 200:
+            raise RuntimeError(f'{output} returned {response.status_code}')
+
+        value = json.loads(data)['response']['props'][prop]
+        self.values[output] = value
+        self.fire({output})
+
+def hover_sweep(page, states, year):
+    '''
+    The mouse dragged across the choropleth, one hover per state
+    '''
+    page.set({'choropleth-slider-year.value': year})
+    for state in states:
+        page.set({'choropleth-plot.hoverData': {'points': [{'text': state}]}})
+
+def choropleth_controls(page):
+    '''
+    Every year, feature and metric on the choropleth, one change at a time
+    '''
+    for year in range(2014, 2018):
+        page.set({'choropleth-slider-year.value': year})
+        for feature in ['Killed', 'Injured', 'Total']:
+            page.set({'choropleth-dropdown-feature.value': feature})
+            for metric in ['Raw', 'Per 100,000']:
+                page.set({'choropleth-radio-metric.value': metric})
+
+def click_compare(page, clicked, hovered):
+    '''
+    A state clicked on, then compared against hovering the others
+    '''
+    page.set({'choropleth-plot.clickData': {'points': [{'text': clicked}]}})
+    for state in hovered:
+        page.set({'choropleth-plot.hoverData': {'points': [{'text': state}]}})
+
+def map_toggles(page, state, center, rng):
+    '''
+    Picking a state on the incident map, ticking its years on one at a time,
+    going through the filters, panning/zooming around and looking at
+    everything in view
+    '''
+    page.set({'incident-dropdown-state.value': state,
+              'incident-checklist-year.values': [2017]})
+    for year in range(2014, 2019):
+        years = sorted(set(page.values['incident-checklist-year.values']) |
+                       {year})
+        page.set({'incident-checklist-year.values': years})
+    for feature in ['Killed Only', 'Injured Only', 'Show All']:
+        page.set({'incident-radio-feature.value': feature})
+    lat, lon = center
+    for zoom in [6, 7.5, 9, 10.5, 12]:
+        page.set({'incident-plot.relayoutData': {
+            'mapbox.center': {'lat': lat + rng.normal(0, 0.3),
+                              'lon': lon + rng.normal(0, 0.3)},
+            'mapbox.zoom': zoom,
+        }})
+    page.set({'incident-radio-scope.value': 'Viewport'})
+    page.set({'incident-radio-scope.value': 'State'})
+
+def incident_hovers(page, incident_ids):
+    '''
+    The mouse going over incident markers
+    '''
+    for incident_id in incident_ids:
+        page.set({'incident-plot.hoverData': {'points': [
+            {'curveNumber': 0, 'pointNumber': 0,
+             'customdata': int(incident_id)}]}})
+
+def summarize(page):
+    '''
+    Returns {callback: {'calls', 'p50', 'p95', 'p99' (ms), 'kb' (mean),
+    'rss' (peak MB)}}
+    '''
+    results = {}
+    for output, seconds in sorted(page.seconds.items()):
+        p50, p95, p99 = np.percentile(np.array(seconds) * 1000, [50, 95, 99])
+        results[output] = {
+            'calls': len(seconds),
+            'p50': p50,
+            'p95': p95,
+            'p99': p99,
+            'kb': np.mean(page.bytes[output]) / 1024,
+            'rss': page.rss[output],
+        }
+    return results
+
+def regressions(results, baseline, threshold, slack_ms):
+    '''
+    Returns a line for every callback whose p95 or response size grew past
+    threshold times the baseline's. slack_ms keeps sub-millisecond
+    callbacks from tripping on timer noise
+    '''
+    lines = []
+    for output, now in results.items():
+        then = baseline.get(output)
+        if then is None:
+            continue
+        if now['p95'] > then['p95'] * threshold + slack_ms:
+            lines.append(f'{output} p95 {then["p95"]:.1f}ms -> '
+                         f'{now["p95"]:.1f}ms')
+        if now['kb'] > then['kb'] * threshold:
+            lines.append(f'{output} {then["kb"]:.1f}kB -> {now["kb"]:.1f}kB')
+    return lines
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Replays interaction traces against every Dash callback '
+                    'through the Flask test client, on made up data')
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='synthetic incidents (default 100000)')
+    parser.add_argument('--passes', type=int, default=3,
+                        help='times to replay the traces (default 3)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cold', action='store_true',
+                        help='turn off the figure cache, every call renders')
+    parser.add_argument('--save', metavar='PATH',
+                        help='write the results as json, to use as a baseline')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='exit 1 if anything regressed against these '
+                             'saved results')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='how many times the baseline p95/size counts as '
+                             'a regression (default 1.25)')
+    parser.add_argument('--slack-ms', type=float, default=1.0,
+                        help='extra ms of p95 allowed on top of the '
+                             'threshold (default 1.0)')
+    args = parser.parse_args()
+    # Both are read/written after moving into the data dir
+    save, baseline_path = [os.path.abspath(i) if i else None
+                           for i in (args.save, args.baseline)]
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.time()
+        write_data(tmp, args.rows, args.seed)
+        print(f'{args.rows} synthetic incidents in {time.time() - start:.1f}s')
+
+        # app.py reads data/ relative to where it runs. The token only ends
+        # up in the map layouts
+        os.chdir(tmp)
+        os.environ['MAPBOX_ACCESS_TOKEN'] = 'benchmark'
+        os.environ.pop('FIGURE_CACHE', None)
+        if args.cold:
+            os.environ['FIGURE_CACHE_SIZE'] = '0'
+        start = time.time()
+        import app
+        print(f'app imported in {time.time() - start:.1f}s '
+              f'(store build included), {peak_rss():.0f} MB RSS')
+
+        rng = np.random.default_rng(args.seed)
+        page = Page(app.app, app.server.test_client())
+        states = list(app.df_state.index)
+        incident_ids = rng.choice(app.gv_store.column('incident_id'), 200)
+        start = time.time()
+        for _ in range(args.passes):
+            page.load()
+            hover_sweep(page, states, 2017)
+            choropleth_controls(page)
+            click_compare(page, 'Illinois', states[::3])
+            for state in ['Illinois', 'California', 'Wyoming']:
+                map_toggles(page, state, app.state_center(state), rng)
+            incident_hovers(page, incident_ids)
+        print(f'{sum(len(i) for i in page.seconds.values())} requests in '
+              f'{time.time() - start:.1f}s')
+        os.chdir(cwd)
+
+    results = summarize(page)
+    print(f'\n{"callback":29}{"calls":>6}{"p50 ms":>9}{"p95 ms":>9}'
+          f'{"p99 ms":>9}{"mean kB":>9}{"peak MB":>9}')
+    for output, r in results.items():
+        print(f'{output:29}{r["calls"]:>6}{r["p50"]:>9.2f}{r["p95"]:>9.2f}'
+              f'{r["p99"]:>9.2f}{r["kb"]:>9.1f}{r["rss"]:>9.0f}')
+
+    if save:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        lines = regressions(results, baseline, args.threshold, args.slack_ms)
+        print(f'\n{len(lines)} regressions past {args.threshold}x baseline')
+        for line in lines:
+            print(f'  {line}')
+        if lines:
+            sys.exit(1)
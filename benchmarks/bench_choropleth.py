@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Run from the repo root so data/state_clean.csv is found
+sys.path.insert(0, os.getcwd())
+from state_cube import StateCube, FEATURES, METRICS
+
+df_state = pd.read_csv('data/state_clean.csv', index_col='state')
+df_state.drop('United States', inplace=True)
+
+def lookup(state, feature, years=range(2014, 2018)):
+    '''
+    The old df_state label lookups
+    '''
+    return [df_state.loc[state, f'{feature}{year}'] for year in years]
+
+def old_trend(state, feature, metric):
+    if feature != 'Total':
+        y = lookup(state, feature.lower())
+    else:
+        y = np.array(lookup(state, 'killed')) + \
+            np.array(lookup(state, 'injured'))
+    if metric == 'Per 100,000':
+        pop = np.array(lookup(state, 'popestimate'))
+        y = np.array(y) / (pop / 100000)
+    return np.array(y)
+
+def old_totals(state, year):
+    row = df_state.loc[state]
+    killed = row[f'killed{year}']
+    injured = row[f'injured{year}']
+    raw = [killed, injured, killed + injured]
+    return np.array(raw), np.round(np.array(raw) /
+                                   (row[f'popestimate{year}'] / 100000), 2)
+
+def old_year(year, feature, metric):
+    if feature != 'Total':
+        z = df_state[feature.lower() + str(year)]
+    else:
+        z = df_state['killed' + str(year)] + df_state['injured' + str(year)]
+    if metric == 'Per 100,000':
+        z = (z / (df_state['popestimate' + str(year)] / 100000)).round(2)
+    return z.values
+
+def per_call(func, calls, repeats=5):
+    '''
+    Best of repeats microseconds per call
+    '''
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for args in calls:
+            func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best / len(calls) * 1e6
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    cube = StateCube(df_state)
+    print(f'cube built in {(time.perf_counter() - start) * 1000:.2f}ms, '
+          f'{cube.cube.nbytes} bytes')
+
+    def new_year(year, feature, metric):
+        z = cube.year(year, feature, metric)
+        return z.round(2) if metric == 'Per 100,000' else z
+
+    def new_totals(state, year):
+        raw, per = cube.totals(state, year)
+        return raw, per.round(2)
+
+    # Hovering a state and then clicking another is two trends per figure
+    trend_calls = [(state, feature, metric) for state in df_state.index
+                   for feature in FEATURES for metric in METRICS]
+    totals_calls = [(state, year) for state in df_state.index
+                    for year in range(2014, 2018)]
+    year_calls = [(year, feature, metric) for year in range(2014, 2018)
+                  for feature in FEATURES for metric in METRICS]
+
+    for name, old, new, calls in [
+            ('choropleth_trend', old_trend, cube.trend, trend_calls),
+            ('choropleth_totals', old_totals, new_totals, totals_calls),
+            ('choropleth_plot', old_year, new_year, year_calls)]:
+        for args in calls:
+            assert np.array_equal(np.ravel(old(*args)), np.ravel(new(*args)))
+        old_us, new_us = per_call(old, calls), per_call(new, calls)
+        print(f'{name:18} label lookups {old_us:8.1f}us  '
+              f'cube {new_us:6.1f}us  {old_us / new_us:6.0f}x, same values')
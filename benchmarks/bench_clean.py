@@ -0,0 +1,248 @@
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'scraper'))
+import clean
+from records import COLUMNS
+
+raw_columns = [
+    'incident_id', 'date', 'state', 'city_or_county', 'address', 'n_killed',
+    'n_injured', 'incident_url', 'source_url', 'incident_url_fields_missing',
+    'congressional_district', 'gun_stolen', 'gun_type',
+    'incident_characteristics', 'latitude', 'location_description',
+    'longitude', 'n_guns_involved', 'notes', 'participant_age',
+    'participant_age_group', 'participant_gender', 'participant_name',
+    'participant_relationship', 'participant_status', 'participant_type',
+    'sources', 'state_house_district', 'state_senate_district'
+]
+
+def indexed(rng, choices, n):
+    '''
+    n "0::a||1::b" strings of 1-12 items, about 1 in 10 missing
+    '''
+    values = []
+    for _ in range(n):
+        if rng.random() < 0.1:
+            values.append(np.nan)
+            continue
+        items = rng.choice(choices, rng.integers(1, 13))
+        values.append('||'.join(f'{i}::{item}' for i, item in enumerate(items)))
+    return values
+
+def write_raw(path, n_rows, seed=0):
+    '''
+    Kaggle shaped csv of n_rows made up incidents, 2013 to 2018
+    '''
+    rng = np.random.default_rng(seed)
+    states = [state for state in clean.us_state_abbrev if state != 'United States']
+    states.append('District of Columbia')
+    days = pd.date_range('2013-01-01', '2018-03-31').strftime('%Y-%m-%d')
+    df = pd.DataFrame({col: np.nan for col in raw_columns}, index=range(n_rows))
+    df['incident_id'] = rng.permutation(n_rows) + 90000
+    df['date'] = np.sort(rng.choice(days, n_rows))
+    df['state'] = rng.choice(states, n_rows)
+    df['city_or_county'] = rng.choice(['Chicago', 'Springfield', 'Aurora'],
+                                      n_rows)
+    df['address'] = [f'{i} block of Main St' for i in rng.integers(1, 9999,
+                                                                  n_rows)]
+    df['n_killed'] = rng.poisson(0.3, n_rows)
+    df['n_injured'] = rng.poisson(0.6, n_rows)
+    df['incident_url'] = [f'http://www.gunviolencearchive.org/incident/{i}'
+                          for i in df['incident_id']]
+    df['source_url'] = 'http://example.com/news'
+    df['gun_stolen'] = indexed(rng, ['Unknown', 'Stolen'], n_rows)
+    df['gun_type'] = indexed(rng, ['Handgun', '9mm', 'Unknown'], n_rows)
+    df['incident_characteristics'] = [
+        '||'.join(rng.choice(['Shot - Wounded/Injured', 'Drive-by',
+                              'Shot - Dead (murder, accidental, suicide)'],
+                             rng.integers(1, 4)))
+        for _ in range(n_rows)]
+    df['latitude'] = rng.uniform(25, 49, n_rows).round(4)
+    df['longitude'] = rng.uniform(-124, -67, n_rows).round(4)
+    df['notes'] = 'Victim shot, suspect fled'
+    df['participant_age'] = indexed(rng, ['19', '25', '43'], n_rows)
+    df['participant_age_group'] = indexed(rng, ['Adult 18+', 'Teen 12-17'],
+                                          n_rows)
+    df['participant_gender'] = indexed(rng, ['Male', 'Female'], n_rows)
+    df['participant_name'] = indexed(rng, ['Jane Doe', 'John Doe'], n_rows)
+    df['participant_relationship'] = indexed(rng, ['Family', 'Stranger'],
+                                             n_rows)
+    df['participant_status'] = indexed(rng, ['Injured', 'Killed'], n_rows)
+    df['participant_type'] = indexed(rng, ['Victim', 'Subject-Suspect'],
+                                     n_rows)
+    df['sources'] = 'http://example.com/news'
+    df.to_csv(path, index=False)
+
+def write_scraped(path, ids, seed=0):
+    '''
+    Appends made up incidents with these ids to an id_data.csv like the
+    scrapers do
+    '''
+    rng = np.random.default_rng(seed)
+    n_rows = len(ids)
+    states = [state for state in clean.us_state_abbrev if state != 'United States']
+    df = pd.DataFrame({col: '' for col in COLUMNS}, index=range(n_rows))
+    df['incident_id'] = ids
+    df['date'] = rng.choice(pd.date_range('2017-06-01', '2017-12-31')
+                            .strftime('%Y-%m-%d'), n_rows)
+    df['state'] = rng.choice(states, n_rows)
+    df['city'] = 'Springfield'
+    df['lat'] = rng.uniform(25, 49, n_rows).round(4)
+    df['lon'] = rng.uniform(-124, -67, n_rows).round(4)
+    df['gun_types'] = 'Handgun||9mm'
+    df['participant_status'] = 'Injured||Unharmed, Arrested'
+    df['n_killed'] = rng.poisson(0.3, n_rows)
+    df['n_injured'] = rng.poisson(0.6, n_rows)
+    new = not os.path.isfile(path)
+    df.to_csv(path, mode='a', header=new, index=False)
+
+def write_population(path):
+    '''
+    Census estimates laid out like nst-est2017-alldata.csv, so the rows the
+    notebook drops by position are the regions, DC and the territories
+    '''
+    names = ['United States', 'Northeast Region', 'Midwest Region',
+             'South Region', 'West Region']
+    states = sorted(state for state in clean.us_state_abbrev
+                    if state != 'United States')
+    names += states[:8] + ['District of Columbia'] + states[8:]
+    names += ['Puerto Rico', 'Guam', 'Virgin Islands']
+    df = pd.DataFrame({'NAME': names})
+    for year in range(2010, 2018):
+        df[f'POPESTIMATE{year}'] = np.linspace(1e6, 4e7, len(names)).round()
+    df.to_csv(path, index=False)
+
+def notebook(raw_path, population_path, centers):
+    '''
+    clean.ipynb's cells as they are, minus the geocoding
+    '''
+    df_gv = pd.read_csv(raw_path)
+    df_gv.drop(columns=clean.drop_cols, inplace=True)
+    df_gv['date'] = pd.to_datetime(df_gv['date'])
+    df_gv = df_gv[df_gv['date'].apply(lambda x: x.year >= 2014)]
+
+    def cleaner(string):
+        if type(string) != str:
+            return string
+        else:
+            cleaned_list = [word[3:] for word in string.split('||')]
+            cleaned_string = ','.join(cleaned_list)
+            return cleaned_string
+
+    for col in clean.clean_cols:
+        df_gv[col] = df_gv[col].apply(cleaner)
+
+    def clean_inc_chars(x):
+        if type(x) == str:
+            return ','.join(x.split('||'))
+        else:
+            return x
+
+    df_gv['incident_characteristics'] = \
+        df_gv['incident_characteristics'].apply(clean_inc_chars)
+
+    df_state = pd.read_csv(population_path)
+    df_state.columns = [col.lower() for col in df_state.columns]
+    df_state.drop([1, 2, 3, 4, 13, 56, 57, 58], inplace=True)
+    df_state = df_state[['name', 'popestimate2014', 'popestimate2015',
+                         'popestimate2016', 'popestimate2017']]
+    df_state = df_state.rename(columns={'name': 'state'})
+    df_state['code'] = df_state['state'].apply(
+        lambda state: clean.us_state_abbrev[state])
+    df_state['center'] = df_state['state'].map(centers)
+
+    df_gv['year'] = df_gv['date'].apply(lambda x: x.year)
+    for year in [2014, 2015, 2016, 2017]:
+        killed = []
+        injured = []
+        for state in df_state['state']:
+            df_temp = df_gv[np.logical_and(df_gv['state'] == state,
+                                           df_gv['year'] == year)]
+            killed.append(df_temp['n_killed'].sum())
+            injured.append(df_temp['n_injured'].sum())
+        killed[0] = sum(killed)
+        injured[0] = sum(injured)
+        df_state[f'killed{year}'] = killed
+        df_state[f'injured{year}'] = injured
+
+    df_state = df_state[[
+        'code', 'state', 'center', 'popestimate2014', 'popestimate2015',
+        'popestimate2016', 'popestimate2017',
+        'killed2014', 'killed2015', 'killed2016', 'killed2017',
+        'injured2014', 'injured2015', 'injured2016', 'injured2017'
+    ]]
+    return df_gv.drop(columns='year'), df_state
+
+if __name__ == '__main__':
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 240000
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_path = os.path.join(tmp, 'raw.csv')
+        population_path = os.path.join(tmp, 'population.csv')
+        write_raw(raw_path, n_rows)
+        write_population(population_path)
+        centers = {state: '' if state == 'United States' else '40.0,-90.0'
+                   for state in clean.us_state_abbrev}
+        print(f'{n_rows} synthetic incidents, '
+              f'{os.path.getsize(raw_path) / 1e6:.0f} MB')
+
+        start = time.time()
+        df_gv, df_state = notebook(raw_path, population_path, centers)
+        df_gv.to_csv(os.path.join(tmp, 'nb_clean.csv'), index=False)
+        df_state.to_csv(os.path.join(tmp, 'nb_state.csv'), index=False)
+        print(f'notebook:         {time.time() - start:.2f}s')
+
+        for workers in sorted({1, os.cpu_count()}):
+            clean_path = os.path.join(tmp, f'clean_{workers}.csv')
+            state_path = os.path.join(tmp, f'state_{workers}.csv')
+            start = time.time()
+            totals, _ = clean.update([(raw_path, 'kaggle')], clean_path,
+                                     workers=workers)
+            clean.clean_states(totals, population_path, centers).to_csv(
+                state_path, index=False)
+            seconds = time.time() - start
+            same = [open(os.path.join(tmp, nb)).read() == open(path).read()
+                    for nb, path in [('nb_clean.csv', clean_path),
+                                     ('nb_state.csv', state_path)]]
+            print(f'clean.py x{workers:<2}      {seconds:.2f}s, output '
+                  f'{"identical" if all(same) else "DIFFERENT"}')
+
+        # Nightly refresh: the scrapers appended a few thousand incidents,
+        # some of them again and some the Kaggle csv already has
+        clean_path = os.path.join(tmp, 'clean_1.csv')
+        state_path = os.path.join(tmp, 'state_1.csv')
+        scraped_path = os.path.join(tmp, 'id_data.csv')
+        sources = [(raw_path, 'kaggle'), (scraped_path, 'scraped')]
+        rng = np.random.default_rng(0)
+        for night in range(3):
+            first_id = 2000000 + 3000 * night
+            ids = np.concatenate([
+                np.arange(first_id, first_id + 3000),
+                rng.integers(first_id - 3000, first_id, 200),
+                rng.integers(90000, 90000 + n_rows, 200),
+            ])
+            write_scraped(scraped_path, rng.permutation(ids), night)
+            start = time.time()
+            clean.main(sources, population_path, clean_path, state_path,
+                       workers=1)
+            seconds = time.time() - start
+            n_ids = pd.read_csv(clean_path, usecols=['incident_id'])[
+                'incident_id']
+            print(f'night {night}, +3400 scraped  incremental {seconds:.2f}s, '
+                  f'{n_ids.duplicated().sum()} duplicate ids')
+
+        os.remove(clean_path + '.manifest.json')
+        full_state = os.path.join(tmp, 'state_full.csv')
+        os.replace(state_path, full_state)
+        incremental = open(clean_path).read()
+        start = time.time()
+        clean.main(sources, population_path, clean_path, full_state,
+                   workers=1)
+        print(f'full rebuild of the same       {time.time() - start:.2f}s, '
+              f'output {"identical" if open(clean_path).read() == incremental else "DIFFERENT"}')
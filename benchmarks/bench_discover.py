@@ -0,0 +1,64 @@
+import os
+import sys
+import random
+import tempfile
+
+import numpy as np
+
+# The scraper modules import each other as siblings
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'scraper'))
+from index_scraper import Prober
+from mock_server import serve
+import discover
+
+def layout(upper, seed=0):
+    '''
+    Sparse id space like the real one: runs of 20-400 ids where about 70%
+    exist, with gaps of 500-5000 ids between them
+    '''
+    rng = random.Random(seed)
+    ids = set()
+    idx = rng.randint(1, 2000)
+    while idx < upper:
+        length = rng.randint(20, 400)
+        ids.update(i for i in range(idx, min(idx + length, upper))
+                   if rng.random() < 0.7)
+        idx += length + rng.randint(500, 5000)
+    return ids
+
+if __name__ == '__main__':
+    upper = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    ids = layout(upper)
+    server = serve(exists=ids.__contains__)
+
+    # Pretend an earlier run got a fifth of the ids in the first half
+    rng = random.Random(1)
+    known = np.array(sorted(i for i in ids if i < upper // 2
+                            and rng.random() < 0.2), dtype=np.int64)
+    density = discover.learn(known)
+    print(f'{upper} id space, {len(ids)} exist, {len(known)} known, '
+          f'{density}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prober = Prober(server.base_url, concurrency=100,
+                        checkpoint_path=os.path.join(tmp, 'ck.db'),
+                        out=os.path.join(tmp, 'scraped_ids.csv'))
+        discover.discover(prober, 1, upper, density, known)
+        prober.close()
+        found = set(discover.known_ids(tmp)) | set(known)
+
+    requests = prober.n_requests()
+    new = prober.n_found
+    exhaustive = upper - len(known)
+    print(f'\ndiscovery:  {requests} requests, {new} new ids, '
+          f'{requests / new:.2f} requests per id, '
+          f'{len(found & ids) / len(ids):.1%} of the ids found')
+    print(f'exhaustive: {exhaustive} requests, {len(ids) - len(known)} new '
+          f'ids, {exhaustive / (len(ids) - len(known)):.2f} requests per id')
+    # Part of the saving is recall: runs shorter than the stride, or whose
+    # samples all land in holes, are never found
+    print(f'discovery missed {len(ids - found)} ids exhaustive finds, '
+          f'{requests / exhaustive:.1%} of its requests for '
+          f'{len(found & ids) / len(ids):.1%} of the ids')
+    server.shutdown()
@@ -0,0 +1,23 @@
+import os
+import sys
+
+# The scraper modules import each other as siblings
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'scraper'))
+from fetch import FetchEngine
+from mock_server import serve, exists
+
+if __name__ == '__main__':
+    n_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    server = serve(latency=latency)
+    ids = [i for i in range(1, 10 * n_pages) if exists(i)][:n_pages]
+    urls = [server.base_url + str(i) for i in ids]
+    print(f'{n_pages} canned pages, {latency * 1000:.0f}ms server latency')
+    for concurrency in [1, 8, 32, 64]:
+        engine = FetchEngine(concurrency=concurrency, rate=None)
+        n_ok = sum(status_code == 200
+                   for _, status_code, _ in engine.fetch_all(urls))
+        print(f'concurrency {concurrency:>3}: {engine.report()}, {n_ok} ok')
+    server.shutdown()
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import geocode
+import clean
+
+if __name__ == '__main__':
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    states = list(clean.us_state_abbrev)
+    # Every rebuild asks for the 50 capitals, scraped addresses repeat a lot
+    queries = [f'{clean.capital_dict[state]} {state}' for state in states
+               if state != 'United States']
+    queries += [f'{i % 40} Main St, Springfield, Illinois' for i in range(200)]
+    print(f'{len(queries)} queries, {len(set(queries))} distinct, '
+          f'{latency * 1000:.0f}ms per geocoder call')
+
+    stub = geocode.StubGeocoder(latency=latency)
+    start = time.time()
+    for query in queries:
+        stub.geocode(query)
+    print(f'serial, no cache (notebook):   {time.time() - start:.2f}s, '
+          f'{stub.n_calls} calls')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for concurrency in [1, 8]:
+            stub = geocode.StubGeocoder(latency=latency)
+            resolver = geocode.Resolver(stub, geocode.GeocodeCache(
+                os.path.join(tmp, f'cold_{concurrency}.db')),
+                concurrency=concurrency, rate=None)
+            start = time.time()
+            resolver.resolve(queries)
+            print(f'batch x{concurrency}, cold cache:          '
+                  f'{time.time() - start:.2f}s, {stub.n_calls} calls')
+
+        resolver = geocode.Resolver(None, geocode.GeocodeCache(
+            os.path.join(tmp, 'cold_8.db')), offline=True)
+        start = time.time()
+        locations = resolver.resolve(queries)
+        print(f'offline, warm cache:           {time.time() - start:.3f}s, '
+              f'0 calls, {sum(v is not None for v in locations.values())} '
+              f'found')
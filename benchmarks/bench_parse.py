@@ -0,0 +1,164 @@
+import os
+import sys
+import glob
+import time
+
+# The scraper modules import each other as siblings
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'scraper'))
+from bs4 import BeautifulSoup
+import pandas as pd
+import incident_scraper
+from mock_server import incident_page
+from records import Incident, Location
+
+def load_corpus(path):
+    '''
+    Returns the html of every saved page in the directory, or 200 canned
+    mock pages if no directory is given
+    '''
+    if path is None:
+        return [incident_page(i) for i in range(51, 251)]
+    pages = []
+    for filename in sorted(glob.glob(os.path.join(path, '*.html'))):
+        with open(filename, encoding='utf-8') as f:
+            pages.append(f.read())
+    return pages
+
+def legacy_lookup(soup):
+    '''
+    The section lookups soup_eater used to do: a find_all('h2') over the
+    page, then every scrape_* helper walking all of block-system-main's
+    divs looking for its h2
+    '''
+    main_divs = soup.find('div', {'id': 'block-system-main'}).select('div')
+    h2s = [h2.text for h2 in soup.find_all('h2')]
+    sections = {}
+    for title in ['Location', 'Participants', 'Guns Involved',
+                  'Incident Characteristics', 'Notes', 'Sources']:
+        # soup_eater only called the helpers of sections the page has
+        if title not in h2s:
+            continue
+        for div in main_divs:
+            if title in [h2.text for h2 in div.find_all('h2')]:
+                sections[title] = div
+    return sections
+
+def legacy_participants(section):
+    '''
+    The old scrape_participants: every trait += onto a one row DataFrame,
+    then the row rendered as csv text
+    '''
+    list_items = [li.text for li in section.find_all('li')]
+
+    cols = ['type', 'status', 'name', 'age', 'age_group', 'gender']
+    data = [['' for col in cols]]
+    part_df = pd.DataFrame(data=data, columns=cols)
+    for item in list_items:
+        trait = item.split(': ')[0].lower().replace(' ', '_')
+        if trait == 'relationship':
+            continue
+        value = item.split(': ')[1]
+        value = value.replace(',', ';')
+        if part_df[trait][0] != '':
+            value = '||' + value
+        part_df[trait] += value
+
+    statuses = part_df['status'].iloc[0].split('||')
+    statuses = [status.lower() for status in statuses]
+    n_killed = str(statuses.count('killed'))
+    n_injured = str(statuses.count('injured'))
+
+    data = part_df.values.astype(str)[0]
+    data = ','.join(data) + ','
+    return n_killed + ',' + n_injured + ',' + data
+
+def legacy_guns(section):
+    '''
+    The old scrape_guns, same one row DataFrame. Its '||' line never did
+    anything, kept as it was
+    '''
+    list_items = [li.text for li in section.find_all('li')]
+
+    cols = ['type', 'stolen']
+    data = [['' for col in cols]]
+    gun_df = pd.DataFrame(data=data, columns=cols)
+    for item in list_items:
+        trait = item.split(': ')[0].lower().replace(' ', '_')
+        value = item.split(': ')[1]
+        if trait:
+            '||' + value
+        gun_df[trait] += value
+
+    data = gun_df.values.astype(str)[0]
+    return ','.join(data) + ','
+
+def legacy_people(sections):
+    '''
+    Participants and guns of a page into csv text the DataFrame way
+    '''
+    data = ''
+    if 'Guns Involved' in sections:
+        data += legacy_guns(sections['Guns Involved'])
+    if 'Participants' in sections:
+        data += legacy_participants(sections['Participants'])
+    return data
+
+def record_people(sections):
+    '''
+    Participants and guns of a page into csv fields the records way
+    '''
+    guns = incident_scraper.scrape_guns(sections['Guns Involved']) \
+        if 'Guns Involved' in sections else ()
+    participants = \
+        incident_scraper.scrape_participants(sections['Participants']) \
+        if 'Participants' in sections else ()
+    return Incident(0, '', Location(), guns=guns,
+                    participants=participants).fields()
+
+def best_of(func, pages, repeats):
+    '''
+    Returns the best per page time in ms of running func over the corpus
+    '''
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for page in pages:
+            func(page)
+        best = min(best, time.perf_counter() - start)
+    return best / len(pages) * 1000
+
+if __name__ == '__main__':
+    pages = load_corpus(sys.argv[1] if len(sys.argv) > 1 else None)
+    repeats = 5
+
+    print(f'{len(pages)} pages')
+    for features in ['html.parser', 'lxml']:
+        try:
+            BeautifulSoup('', features)
+        except Exception:
+            print(f'{features:12} not installed')
+            continue
+        parsed = [BeautifulSoup(page, features) for page in pages]
+        build = best_of(lambda page: BeautifulSoup(page, features), pages,
+                        repeats)
+        soups = iter(parsed * repeats)
+        extract = best_of(lambda page: incident_scraper.soup_eater(
+            next(soups), 0).fields(), pages, repeats)
+        soups = iter(parsed * repeats * 2)
+        legacy = best_of(lambda page: legacy_lookup(next(soups)), pages,
+                         repeats)
+        single = best_of(lambda page: incident_scraper.split_sections(
+            next(soups)), pages, repeats)
+        # Both get the same pages' sections, split up front
+        sections = [incident_scraper.split_sections(soup) for soup in parsed]
+        split = iter(sections * repeats * 2)
+        frames = best_of(lambda page: legacy_people(next(split)), pages,
+                         repeats)
+        tuples = best_of(lambda page: record_people(next(split)), pages,
+                         repeats)
+        print(f'{features:12} build soup {build:.3f} ms/page, '
+              f'extract row {extract:.3f} ms/page, section lookup '
+              f'{legacy:.3f} -> {single:.3f} ms/page (per-helper scans -> '
+              f'single pass), participants/guns {frames:.3f} -> '
+              f'{tuples:.3f} ms/page (DataFrames -> records)')
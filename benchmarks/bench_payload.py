@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import time
+import inspect
+
+import plotly
+
+# Run from the repo root so app.py finds data/. The token only ends up in the
+# figure layout, it doesn't matter for sizes
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault('MAPBOX_ACCESS_TOKEN', 'benchmark')
+import app
+
+def measure(years, state, feature, repeats):
+    '''
+    Returns (bytes, best build seconds, best encode seconds) for one
+    incident_plot figure, bypassing the figure cache
+    '''
+    incident_plot = inspect.unwrap(app.incident_plot)
+    build, encode = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        figure = incident_plot(list(years), state, feature, 'State', None)
+        build.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        payload = json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+        encode.append(time.perf_counter() - start)
+    return len(payload), min(build), min(encode)
+
+def session(state):
+    '''
+    Returns (server requests, server kB, browser requests, browser kB) of
+    picking a state, ticking its years on one at a time and going through
+    the Killed/Injured filters, with and without browser side filtering
+    '''
+    incident_plot = inspect.unwrap(app.incident_plot)
+    calls = [(list(range(2014, year + 1)), 'Show All')
+             for year in range(2014, 2019)]
+    calls += [(list(range(2014, 2019)), feature)
+              for feature in ['Killed Only', 'Injured Only', 'Show All']]
+    server = sum(len(json.dumps(incident_plot(years, state, feature, 'State',
+                                              None),
+                                cls=plotly.utils.PlotlyJSONEncoder))
+                 for years, feature in calls)
+    # The data url callback's response is ~100 bytes
+    browser = len(app.state_dataset(state)[0]) + 100
+    return len(calls), server / 1024, 2, browser / 1024
+
+def wire(state, encoding):
+    '''
+    Returns the bytes on the wire of the incident_plot response for a state
+    with every year ticked, through the real server with Accept-Encoding set
+    to encoding. The figure cache is skipped so each encoding renders fresh
+    '''
+    body = json.dumps({
+        'output': {'id': 'incident-plot', 'property': 'figure'},
+        'inputs': [
+            {'id': 'incident-checklist-year', 'property': 'values',
+             'value': list(range(2014, 2019))},
+            {'id': 'incident-dropdown-state', 'property': 'value',
+             'value': state},
+            {'id': 'incident-radio-feature', 'property': 'value',
+             'value': 'Show All'},
+            {'id': 'incident-radio-scope', 'property': 'value',
+             'value': 'State'},
+            {'id': 'incident-map-view', 'property': 'children',
+             'value': None},
+        ]
+    })
+    app.figure_cache.memory.entries.clear()
+    response = app.server.test_client().post(
+        '/_dash-update-component', data=body, content_type='application/json',
+        headers={'Accept-Encoding': encoding})
+    return len(response.get_data()), response.headers.get('Content-Encoding')
+
+if __name__ == '__main__':
+    states = sys.argv[1:] or ['Illinois', 'California', 'Wyoming']
+    years = range(2014, 2019)
+    repeats = 5
+
+    print(f'{"state":14}{"mode":9}{"kB":>10}{"build ms":>10}{"encode ms":>11}')
+    for state in states:
+        for compact in [False, True]:
+            app.compact_markers = compact
+            size, build, encode = measure(years, state, 'Show All', repeats)
+            mode = 'compact' if compact else 'full'
+            print(f'{state:14}{mode:9}{size / 1024:>10.1f}'
+                  f'{build * 1000:>10.1f}{encode * 1000:>11.1f}')
+
+    print()
+    print(f'{"state":14}{"server reqs":>12}{"kB":>10}{"browser reqs":>14}'
+          f'{"kB":>10}')
+    app.compact_markers = True
+    for state in states:
+        server_n, server_kb, browser_n, browser_kb = session(state)
+        print(f'{state:14}{server_n:>12}{server_kb:>10.1f}{browser_n:>14}'
+              f'{browser_kb:>10.1f}')
+
+    print()
+    print(f'{"state":14}{"Accept-Encoding":>16}{"kB on the wire":>16}')
+    for state in states:
+        for encoding in ['identity', 'gzip', 'br']:
+            size, used = wire(state, encoding)
+            print(f'{state:14}{encoding:>16}{size / 1024:>16.1f}'
+                  f'{"" if used == encoding else "  (not compressed)"}')
+
+    client = app.server.test_client()
+    layout = client.get('/_dash-layout', headers={'Accept-Encoding': 'gzip'})
+    again = client.get('/_dash-layout', headers={
+        'If-None-Match': layout.headers['ETag']})
+    print(f'\nlayout {len(layout.get_data()) / 1024:.1f} kB gzipped, '
+          f'revalidated: {again.status_code} {len(again.get_data())} bytes')
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+from multiprocessing import cpu_count
+
+# The scraper modules import each other as siblings
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'scraper'))
+from index_scraper import Prober, probe
+from mock_server import serve, exists
+
+if __name__ == '__main__':
+    n_ids = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    server = serve(latency=latency)
+    print(f'{n_ids} ids, {latency * 1000:.0f}ms server latency, '
+          f'{sum(map(exists, range(1, n_ids + 1)))} exist')
+    # cpu_count GETs in flight is what the old Pool(cpu_count()) got
+    runs = [('GET', cpu_count()), ('HEAD', cpu_count()), ('HEAD', 50),
+            ('HEAD', 200)]
+    for method, concurrency in runs:
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, 'scraped_ids.csv')
+            prober = Prober(server.base_url, concurrency, method=method,
+                            checkpoint_path=os.path.join(tmp, 'ck.db'),
+                            out=out)
+            try:
+                probe(prober, 1, n_ids)
+            finally:
+                prober.close()
+            engine = prober.engine
+            with open(out) as f:
+                n_found = sum(1 for _ in f) - 1
+        print(f'>> {method} concurrency {concurrency:>3}: '
+              f'{engine.n_pages / engine.seconds:.0f} ids/sec, '
+              f'{n_found} found')
+    server.shutdown()
@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import subprocess
+
+# Each loader runs in a fresh interpreter so import time and memory aren't
+# shared between them. The child prints a json dict of its own measurements
+CHILD = '''
+import os, sys, time, json, resource
+sys.path.insert(0, {repo!r})
+start = time.time()
+import numpy as np
+import pandas as pd
+{load}
+elapsed = time.time() - start
+private = shared = 0
+with open('/proc/self/smaps_rollup') as f:
+    for line in f:
+        key, value = line.split(':')
+        kb = int(value.split()[0])
+        if key.startswith('Private'):
+            private += kb
+        elif key.startswith('Shared'):
+            shared += kb
+print(json.dumps({{
+    'seconds': elapsed,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'private_mb': private / 1024,
+    'shared_mb': shared / 1024,
+}}))
+'''
+
+CSV_LOAD = '''
+df_gv = pd.read_csv({csv!r}, index_col='incident_id')
+df_gv['date'] = pd.to_datetime(df_gv['date'])
+'''
+
+# Touches the columns the incident map scans on every callback so the pages
+# are actually faulted in, not just mapped
+STORE_LOAD = '''
+from incident_store import IncidentStore
+gv_store = IncidentStore({store!r})
+for col in ['state', 'date', 'n_killed', 'n_injured', 'latitude', 'longitude']:
+    gv_store.column(col).sum() if col != 'date' else len(gv_store.column(col))
+'''
+
+def run(load, repeats):
+    '''
+    Returns the measurements of the fastest of the child runs
+    '''
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = CHILD.format(repo=repo, load=load)
+    results = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             stdout=subprocess.PIPE).stdout
+        results.append(json.loads(out))
+    return min(results, key=lambda i: i['seconds'])
+
+if __name__ == '__main__':
+    csv = sys.argv[1] if len(sys.argv) > 1 else 'data/gun_violence_clean.csv'
+    store = sys.argv[2] if len(sys.argv) > 2 else 'data/incident_store'
+    repeats = 5
+
+    print(f'{"":8}{"seconds":>10}{"max rss mb":>12}'
+          f'{"private mb":>12}{"shared mb":>11}')
+    for name, load in [('csv', CSV_LOAD.format(csv=csv)),
+                       ('store', STORE_LOAD.format(store=store))]:
+        r = run(load, repeats)
+        print(f'{name:8}{r["seconds"]:>10.3f}{r["max_rss_mb"]:>12.1f}'
+              f'{r["private_mb"]:>12.1f}{r["shared_mb"]:>11.1f}')
@@ -0,0 +1,598 @@
+import os
+import io
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+
+import geocode
+
+RAW_PATH = 'data/gun-violence-data_01-2013_03-2018.csv'
+POPULATION_PATH = 'data/nst-est2017-alldata.csv'
+# What the scrapers append to (scraper/records.py COLUMNS)
+SCRAPED_PATH = 'data/id_data.csv'
+CLEAN_PATH = 'data/gun_violence_clean.csv'
+STATE_PATH = 'data/state_clean.csv'
+MANIFEST_VERSION = 3
+
+YEARS = [2014, 2015, 2016, 2017]
+
+drop_cols = [
+    'source_url',
+    'incident_url_fields_missing',
+    'congressional_district',
+    'gun_stolen',
+    'n_guns_involved',
+    'sources',
+    'state_house_district',
+    'state_senate_district'
+]
+
+# "0::Victim||1::Subject-Suspect" style columns
+clean_cols = [
+    'gun_type',
+    'participant_age',
+    'participant_age_group',
+    'participant_gender',
+    'participant_name',
+    'participant_relationship',
+    'participant_status',
+    'participant_type'
+]
+
+# Columns of gun_violence_clean.csv, the raw columns minus drop_cols
+clean_columns = [
+    'incident_id', 'date', 'state', 'city_or_county', 'address', 'n_killed',
+    'n_injured', 'incident_url', 'gun_type', 'incident_characteristics',
+    'latitude', 'location_description', 'longitude', 'notes',
+    'participant_age', 'participant_age_group', 'participant_gender',
+    'participant_name', 'participant_relationship', 'participant_status',
+    'participant_type'
+]
+
+# id_data.csv column -> clean column, where the names differ
+scraped_renames = {
+    'city': 'city_or_county',
+    'lat': 'latitude',
+    'lon': 'longitude',
+    'gun_types': 'gun_type',
+}
+
+# Regions, DC and Puerto Rico rows of the census estimates
+drop_state_rows = [1, 2, 3, 4, 13, 56, 57, 58]
+
+us_state_abbrev = {
+    'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR',
+    'California': 'CA', 'Colorado': 'CO', 'Connecticut': 'CT',
+    'Delaware': 'DE', 'Florida': 'FL', 'Georgia': 'GA', 'Hawaii': 'HI',
+    'Idaho': 'ID', 'Illinois': 'IL', 'Indiana': 'IN', 'Iowa': 'IA',
+    'Kansas': 'KS', 'Kentucky': 'KY', 'Louisiana': 'LA', 'Maine': 'ME',
+    'Maryland': 'MD', 'Massachusetts': 'MA', 'Michigan': 'MI',
+    'Minnesota': 'MN', 'Mississippi': 'MS', 'Missouri': 'MO',
+    'Montana': 'MT', 'Nebraska': 'NE', 'Nevada': 'NV',
+    'New Hampshire': 'NH', 'New Jersey': 'NJ', 'New Mexico': 'NM',
+    'New York': 'NY', 'North Carolina': 'NC', 'North Dakota': 'ND',
+    'Ohio': 'OH', 'Oklahoma': 'OK', 'Oregon': 'OR', 'Pennsylvania': 'PA',
+    'Rhode Island': 'RI', 'South Carolina': 'SC', 'South Dakota': 'SD',
+    'Tennessee': 'TN', 'Texas': 'TX', 'Utah': 'UT', 'Vermont': 'VT',
+    'Virginia': 'VA', 'Washington': 'WA', 'West Virginia': 'WV',
+    'Wisconsin': 'WI', 'Wyoming': 'WY', 'United States': 'US'
+}
+
+capital_dict = {
+    'Alabama': 'Montgomery', 'Alaska': 'Juneau', 'Arizona': 'Phoenix',
+    'Arkansas': 'Little Rock',
+    # Geopy couldn't find Sacramento *shrug*
+    'California': 'Los Angeles',
+    'Colorado': 'Denver', 'Connecticut': 'Hartford', 'Delaware': 'Dover',
+    'Florida': 'Tallahassee', 'Georgia': 'Atlanta', 'Hawaii': 'Honolulu',
+    'Idaho': 'Boise', 'Illinois': 'Springfield', 'Indiana': 'Indianapolis',
+    'Iowa': 'Des Moines', 'Kansas': 'Topeka', 'Kentucky': 'Frankfort',
+    'Louisiana': 'Baton Rouge', 'Maine': 'Augusta', 'Maryland': 'Annapolis',
+    'Massachusetts': 'Boston', 'Michigan': 'Lansing',
+    'Minnesota': 'St. Paul', 'Mississippi': 'Jackson',
+    'Missouri': 'Jefferson City', 'Montana': 'Helena',
+    'Nebraska': 'Lincoln', 'Nevada': 'Carson City',
+    'New Hampshire': 'Concord', 'New Jersey': 'Trenton',
+    'New Mexico': 'Santa Fe', 'New York': 'Albany',
+    'North Carolina': 'Raleigh', 'North Dakota': 'Bismarck',
+    'Ohio': 'Columbus', 'Oklahoma': 'Oklahoma City', 'Oregon': 'Salem',
+    'Pennsylvania': 'Harrisburg', 'Rhode Island': 'Providence',
+    'South Carolina': 'Columbia', 'South Dakota': 'Pierre',
+    'Tennessee': 'Nashville', 'Texas': 'Austin',
+    'Utah': 'Salt Lake City', 'Vermont': 'Montpelier',
+    'Virginia': 'Richmond', 'Washington': 'Olympia',
+    'West Virginia': 'Charleston', 'Wisconsin': 'Madison',
+    'Wyoming': 'Cheyenne'
+}
+
+def strip_indices(series):
+    '''
+    The notebook's cleaner over a whole column: "0::Victim||1::Adult"
+    becomes "Victim,Adult". Like the notebook it cuts the first 3
+    characters off every item, so items numbered 10+ keep a ':'.
+
+    Without pyarrow pandas' .str methods loop over python strings too and
+    the regex this needs made them ~5x slower than this comprehension
+    '''
+    values = [','.join(item[3:] for item in value.split('||'))
+              if isinstance(value, str) else value
+              for value in series.tolist()]
+    return pd.Series(values, index=series.index, dtype=object)
+
+def chunk_totals(df):
+    '''
+    Killed/injured sums by state and year of a cleaned chunk
+    '''
+    return df.groupby([df['state'], df['date'].dt.year.rename('year')])[
+        ['n_killed', 'n_injured']].sum()
+
+def clean_chunk(df):
+    '''
+    Cleans one chunk of the raw Kaggle csv the way clean.ipynb does:
+    drops the unused columns and the pre 2014 incidents and turns the '||'
+    lists into ',' lists.
+
+    Returns (the cleaned chunk, its killed/injured sums by state and year)
+    '''
+    df = df.drop(columns=drop_cols)
+    df['date'] = pd.to_datetime(df['date'])
+    df = df[df['date'].dt.year >= YEARS[0]]
+
+    for col in clean_cols:
+        df[col] = strip_indices(df[col])
+    df['incident_characteristics'] = \
+        df['incident_characteristics'].str.replace('||', ',', regex=False)
+
+    return df, chunk_totals(df)
+
+def clean_scraped_chunk(df):
+    '''
+    Cleans one chunk of the scrapers' id_data.csv into the same columns as
+    clean_chunk. The scraped lists are '||' joined without the "0::"
+    indices, killed/injured counts the scraper couldn't find count as 0
+
+    Returns (the cleaned chunk, its killed/injured sums by state and year)
+    '''
+    df = df.rename(columns=scraped_renames)
+    df['incident_id'] = df['incident_id'].astype(np.int64)
+    for col in ['latitude', 'longitude']:
+        df[col] = pd.to_numeric(df[col])
+    df['date'] = pd.to_datetime(df['date'])
+    df = df[df['date'].dt.year >= YEARS[0]]
+    df['incident_url'] = \
+        'http://www.gunviolencearchive.org/incident/' + \
+        df['incident_id'].astype(str)
+    for col in ['n_killed', 'n_injured']:
+        df[col] = pd.to_numeric(df[col]).fillna(0).astype(np.int64)
+    for col in clean_cols + ['incident_characteristics']:
+        if col in df:
+            df[col] = df[col].str.replace('||', ',', regex=False)
+    df = df.reindex(columns=clean_columns)
+
+    return df, chunk_totals(df)
+
+cleaners = {'kaggle': clean_chunk, 'scraped': clean_scraped_chunk}
+# The scraped csv is read as all text, mostly empty columns would come out
+# as floats otherwise
+read_options = {'kaggle': {}, 'scraped': {'dtype': str}}
+
+def record_ranges(path, start, chunk_bytes):
+    '''
+    Yields (start, end) byte ranges of about chunk_bytes from `start` to the
+    end of the last complete record of a csv. A range always ends on the
+    newline closing a record, quoted fields with newlines in them are kept
+    whole (a record is done once it has an even number of quotes)
+    '''
+    with open(path, 'rb') as f:
+        f.seek(start)
+        end = record_end = start
+        n_quotes = 0
+        for line in f:
+            # A last line without its newline is still being written
+            if not line.endswith(b'\n'):
+                break
+            end += len(line)
+            n_quotes += line.count(b'"')
+            if n_quotes % 2 == 0:
+                n_quotes = 0
+                record_end = end
+                if record_end - start >= chunk_bytes:
+                    yield start, record_end
+                    start = record_end
+        if record_end > start:
+            yield start, record_end
+
+def header(path):
+    '''
+    Returns (the column names, the byte offset where the rows start)
+    '''
+    with open(path, 'rb') as f:
+        line = f.readline()
+    return pd.read_csv(io.BytesIO(line)).columns.tolist(), len(line)
+
+def range_hash(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return hashlib.blake2b(f.read(end - start), digest_size=16).hexdigest()
+
+def fill_coordinates(df, resolver):
+    '''
+    Geocodes "address, city, state" of the rows without a lat/lon, in place
+    '''
+    missing = df['latitude'].isna() & df['address'].notna()
+    if not missing.any():
+        return
+    queries = (df['address'] + ', ' + df['city_or_county'].fillna('') +
+               ', ' + df['state'].fillna(''))[missing]
+    locations = resolver.resolve(queries)
+    found = queries.map(lambda query: locations[query] is not None)
+    rows = found[found].index
+    df.loc[rows, 'latitude'] = [locations[q].latitude for q in queries[rows]]
+    df.loc[rows, 'longitude'] = [locations[q].longitude for q in queries[rows]]
+
+def clean_range(task):
+    '''
+    Reads, cleans and renders one byte range of a source. Runs on the pool
+    so the parsing is spread over the cores too. task is
+    (kind, path, columns, start, end, geocoding), geocoding is None or the
+    arguments of geocode.resolver to fill in missing scraped coordinates
+
+    Returns (csv text, totals, hash of the raw bytes, incident ids)
+    '''
+    kind, path, columns, start, end, geocoding = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    df = pd.read_csv(io.BytesIO(data), header=None, names=columns,
+                     **read_options[kind])
+    df, totals = cleaners[kind](df)
+    if kind == 'scraped' and geocoding is not None:
+        fill_coordinates(df, geocode.resolver(**geocoding))
+    return (df.to_csv(index=False, header=False), totals,
+            hashlib.blake2b(data, digest_size=16).hexdigest(),
+            df['incident_id'].to_numpy())
+
+def first_seen(ids, seen):
+    '''
+    Returns a mask of the ids that aren't in seen or earlier in ids, and
+    adds them to seen
+    '''
+    keep = np.zeros(len(ids), dtype=bool)
+    for i, incident_id in enumerate(ids.tolist()):
+        if incident_id not in seen:
+            seen.add(incident_id)
+            keep[i] = True
+    return keep
+
+def keep_rows(text, keep):
+    '''
+    Cuts a chunk clean_range rendered down to the rows keep is True for.
+    Read back as text so the rows that stay come out byte for byte the same
+
+    Returns (csv text, totals)
+    '''
+    df = pd.read_csv(io.StringIO(text), header=None, names=clean_columns,
+                     dtype=str, keep_default_na=False)[keep]
+    counts = pd.DataFrame({
+        'state': df['state'].replace('', np.nan),
+        'date': pd.to_datetime(df['date']),
+        'n_killed': df['n_killed'].astype(np.int64),
+        'n_injured': df['n_injured'].astype(np.int64),
+    })
+    return df.to_csv(index=False, header=False), chunk_totals(counts)
+
+def written_ids(clean_path, chunks):
+    '''
+    The incident ids already in the clean csv. They're kept next to it in
+    {clean_path}.ids, the int64 ids in the order they were written, and each
+    chunk in the manifest has how many it wrote. The file is cut back to
+    the kept chunks' ids, so an incremental build reads a few bytes per
+    incident instead of parsing the whole csv. A missing or short .ids file
+    (an interrupted write, or a csv from before it existed) gets rebuilt
+    from the csv once
+    '''
+    path = clean_path + '.ids'
+    n_ids = sum(chunk['n_ids'] for chunk in chunks)
+    if os.path.isfile(path) and os.path.getsize(path) >= n_ids * 8:
+        with open(path, 'r+b') as f:
+            f.truncate(n_ids * 8)
+        ids = np.fromfile(path, dtype=np.int64)
+    else:
+        ids = pd.read_csv(clean_path, usecols=['incident_id'])[
+            'incident_id'].to_numpy(dtype=np.int64)
+        ids.tofile(path)
+    return set(ids.tolist())
+
+def chunks_in_order(func, chunks, workers):
+    '''
+    Runs func over the chunks on a process pool and yields the results in
+    the order of the chunks. Only about 2 * workers chunks are read ahead,
+    so memory stays bounded however big the file is. workers=1 runs it all
+    in this process
+    '''
+    if workers == 1:
+        for chunk in chunks:
+            yield func(chunk)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = {}
+        done = {}
+        n_submitted = 0
+        n_yielded = 0
+        for chunk in chunks:
+            pending[pool.submit(func, chunk)] = n_submitted
+            n_submitted += 1
+            while len(pending) >= 2 * workers:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done[pending.pop(future)] = future.result()
+                while n_yielded in done:
+                    yield done.pop(n_yielded)
+                    n_yielded += 1
+        for future in list(pending):
+            done[pending.pop(future)] = future.result()
+        while n_yielded in done:
+            yield done.pop(n_yielded)
+            n_yielded += 1
+
+def load_manifest(clean_path):
+    '''
+    The manifest of what's in clean_path, an empty one if there's none or
+    it doesn't fit the csv
+    '''
+    empty = {'version': MANIFEST_VERSION, 'chunks': []}
+    try:
+        with open(clean_path + '.manifest.json') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return empty
+    if manifest.get('version') != MANIFEST_VERSION or \
+            not os.path.isfile(clean_path) or \
+            os.path.getsize(clean_path) < manifest['header_end']:
+        return empty
+    return manifest
+
+def save_manifest(clean_path, manifest):
+    tmp_path = f'{clean_path}.manifest.json.tmp-{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, clean_path + '.manifest.json')
+
+def unchanged(chunk, verify):
+    '''
+    Whether the raw bytes a chunk was cleaned from are still the same. The
+    cheap check is only that the file still reaches the chunk's end,
+    verify re-hashes the bytes
+    '''
+    path = chunk['path']
+    if not os.path.isfile(path) or os.path.getsize(path) < chunk['end']:
+        return False
+    return not verify or \
+        range_hash(path, chunk['start'], chunk['end']) == chunk['hash']
+
+def update(sources, clean_path=CLEAN_PATH, chunk_bytes=8 << 20, workers=None,
+           verify=False, geocoding=None):
+    '''
+    Brings clean_path up to date with the sources, a list of (path, kind)
+    where kind is a key of cleaners ('kaggle' or 'scraped'), and only
+    cleans what's new since the last build.
+
+    Next to the csv is a manifest of every chunk in it: which byte range of
+    which source it came from, a hash of those bytes, where it ends in the
+    clean csv and its killed/injured totals. The sources are append only,
+    so a build keeps every chunk up to the first one whose source changed
+    (shrank, or with verify its bytes hash differently, which catches
+    edits in the middle but reads the whole history), cuts the csv off
+    there and cleans each source from the end of its last kept chunk. The
+    high-water mark of a source is the end of its last chunk, a source
+    nobody touched costs nothing. With no manifest everything is cleaned.
+
+    Every incident id is written once. The scrapers go over ids more than
+    once and over ids the Kaggle csv already has, so a row whose id is
+    already in the csv (or earlier in its chunk) is dropped, the first
+    record of an incident wins. The chunk totals only count the rows kept.
+    The ids written so far are kept next to the csv, see written_ids.
+
+    The new ranges are cleaned on `workers` processes (all the cores by
+    default) and appended in order. geocoding (the arguments of
+    geocode.resolver) turns on geocoding scraped rows without coordinates,
+    the rate limit is split between the workers. The manifest is saved after every
+    chunk so an interrupted build carries on where it stopped.
+
+    Returns (the killed/injured totals by (state, year) of the whole csv,
+    number of chunks cleaned)
+    '''
+    workers = workers or os.cpu_count()
+    if geocoding is not None and geocoding.get('rate'):
+        geocoding = dict(geocoding, rate=geocoding['rate'] / workers)
+    manifest = load_manifest(clean_path)
+    chunks = manifest['chunks']
+    n_kept = 0
+    while n_kept < len(chunks) and unchanged(chunks[n_kept], verify):
+        n_kept += 1
+    chunks = manifest['chunks'] = chunks[:n_kept]
+
+    mode = 'r+b' if 'header_end' in manifest else 'wb'
+    with open(clean_path, mode) as f:
+        if mode == 'wb':
+            f.write(pd.DataFrame(columns=clean_columns).to_csv(
+                index=False).encode('utf-8'))
+            manifest['header_end'] = f.tell()
+        f.seek(chunks[-1]['out_end'] if chunks else manifest['header_end'])
+        f.truncate()
+        save_manifest(clean_path, manifest)
+
+        def tasks():
+            for path, kind in sources:
+                if not os.path.isfile(path):
+                    continue
+                columns, start = header(path)
+                done = [chunk['end'] for chunk in chunks
+                        if chunk['path'] == path]
+                start = max(done, default=start)
+                for start, end in record_ranges(path, start, chunk_bytes):
+                    yield kind, path, columns, start, end, geocoding
+
+        n_cleaned = 0
+        todo = list(tasks())
+        f.flush()
+        seen = written_ids(clean_path, chunks) if todo else set()
+        with open(clean_path + '.ids', 'ab') as ids_file:
+            for task, (text, totals, digest, ids) in zip(
+                    todo, chunks_in_order(clean_range, todo, workers)):
+                kind, path, _, start, end, _ = task
+                keep = first_seen(ids, seen)
+                if not keep.all():
+                    text, totals = keep_rows(text, keep)
+                f.write(text.encode('utf-8'))
+                f.flush()
+                ids[keep].astype(np.int64).tofile(ids_file)
+                ids_file.flush()
+                chunks.append({
+                    'path': path, 'kind': kind, 'start': start, 'end': end,
+                    'hash': digest, 'out_end': f.tell(),
+                    'n_ids': int(keep.sum()),
+                    'totals': [[state, int(year), int(row['n_killed']),
+                                int(row['n_injured'])]
+                               for (state, year), row in totals.iterrows()],
+                })
+                save_manifest(clean_path, manifest)
+                n_cleaned += 1
+
+    return manifest_totals(manifest), n_cleaned
+
+def manifest_totals(manifest):
+    '''
+    Adds up the killed/injured totals of every chunk in the manifest
+    '''
+    rows = [row for chunk in manifest['chunks'] for row in chunk['totals']]
+    df = pd.DataFrame(rows, columns=['state', 'year', 'n_killed', 'n_injured'])
+    return df.groupby(['state', 'year'])[['n_killed', 'n_injured']].sum()
+
+def state_centers(states, resolver=None):
+    '''
+    Returns "lat,lon" of each state's capital (the US gets ''). Looked up
+    in one batch through a geocode.Resolver, Nominatim behind the geocode
+    cache by default.
+
+    Raises ValueError naming the states whose capital couldn't be found
+    (offline with a cold cache, or the geocoder failing), app.py can't
+    place a state's map without its center
+    '''
+    resolver = resolver or geocode.resolver()
+    queries = {state: f'{capital_dict[state]} {state}'
+               for state in states if state != 'United States'}
+    locations = resolver.resolve(queries.values())
+    unresolved = [state for state, query in queries.items()
+                  if locations.get(query) is None]
+    if unresolved:
+        raise ValueError(f'Could not geocode the capitals of '
+                         f'{", ".join(unresolved)}')
+    centers = []
+    for state in states:
+        location = locations.get(queries.get(state))
+        centers.append('' if location is None else
+                       f'{location.latitude},{location.longitude}')
+    return centers
+
+def clean_states(totals, population_path=POPULATION_PATH, centers=None,
+                 resolver=None):
+    '''
+    Builds state_clean.csv's table out of the census estimates and the
+    totals update returned. centers is {state: "lat,lon"} of
+    centers that are already known, the missing ones get geocoded with the
+    resolver (see state_centers, which raises if any can't be)
+    '''
+    df_state = pd.read_csv(population_path)
+    df_state.columns = [col.lower() for col in df_state.columns]
+    df_state = df_state.drop(drop_state_rows)
+    df_state = df_state[['name'] + [f'popestimate{year}' for year in YEARS]]
+    df_state = df_state.rename(columns={'name': 'state'})
+    df_state['code'] = df_state['state'].map(us_state_abbrev)
+
+    centers = dict(centers or {})
+    missing = [state for state in df_state['state'] if state not in centers]
+    if missing:
+        centers.update(zip(missing, state_centers(missing, resolver)))
+    df_state['center'] = df_state['state'].map(centers)
+
+    fill_totals(df_state, totals)
+
+    return df_state[
+        ['code', 'state', 'center'] +
+        [f'popestimate{year}' for year in YEARS] +
+        [f'killed{year}' for year in YEARS] +
+        [f'injured{year}' for year in YEARS]
+    ]
+
+def fill_totals(df_state, totals):
+    '''
+    Writes the killed{year}/injured{year} columns of the state table from
+    the totals, in place. The first row is the United States and gets the
+    sum of the others
+    '''
+    for measure in ['killed', 'injured']:
+        by_year = totals[f'n_{measure}'].unstack('year')
+        for year in YEARS:
+            by_state = by_year[year] if year in by_year else pd.Series()
+            values = df_state['state'].map(by_state).fillna(0).astype(np.int64)
+            # Sum up United States
+            values.iloc[0] = values.iloc[1:].sum()
+            df_state[f'{measure}{year}'] = values.values
+
+def main(sources, population_path=POPULATION_PATH, clean_path=CLEAN_PATH,
+         state_path=STATE_PATH, chunk_bytes=8 << 20, workers=None,
+         verify=False, geocoding=None):
+    '''
+    Updates the clean csv and the state table. An existing state_clean.csv
+    just gets its killed/injured columns refreshed, the census estimates
+    are only read (and the capitals geocoded) to build it from scratch
+    '''
+    totals, n_cleaned = update(sources, clean_path, chunk_bytes, workers,
+                               verify, geocoding)
+    if os.path.isfile(state_path):
+        df_state = pd.read_csv(state_path, keep_default_na=False)
+        fill_totals(df_state, totals)
+    else:
+        resolver = geocode.resolver(**geocoding) if geocoding else None
+        df_state = clean_states(totals, population_path, resolver=resolver)
+    df_state.to_csv(state_path, index=False)
+    return n_cleaned
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--raw', default=RAW_PATH)
+    parser.add_argument('--scraped', default=SCRAPED_PATH)
+    parser.add_argument('--population', default=POPULATION_PATH)
+    parser.add_argument('--clean', default=CLEAN_PATH)
+    parser.add_argument('--states', default=STATE_PATH)
+    parser.add_argument('--chunk-mb', type=float, default=8)
+    parser.add_argument('--workers', type=int,
+                        help='processes to clean on, all the cores by default')
+    parser.add_argument('--verify', action='store_true',
+                        help='re-hash the history to catch edits, not just '
+                             'appends')
+    parser.add_argument('--full', action='store_true',
+                        help='forget the manifest and clean everything')
+    parser.add_argument('--geocoder', default='nominatim',
+                        choices=['nominatim', 'stub'])
+    parser.add_argument('--geocode-cache', default=geocode.CACHE_PATH)
+    parser.add_argument('--geocode-rate', type=float, default=1.0,
+                        help='max geocoder requests per second')
+    parser.add_argument('--offline', action='store_true',
+                        help='only use the geocode cache')
+    args = parser.parse_args()
+    if args.full and os.path.isfile(args.clean + '.manifest.json'):
+        os.remove(args.clean + '.manifest.json')
+    sources = [(args.raw, 'kaggle'), (args.scraped, 'scraped')]
+    geocoding = {'cache_path': args.geocode_cache, 'geocoder': args.geocoder,
+                  'offline': args.offline, 'rate': args.geocode_rate}
+    n_cleaned = main(sources, args.population, args.clean, args.states,
+                     int(args.chunk_mb * (1 << 20)), args.workers,
+                     args.verify, geocoding)
+    print(f'Cleaned {n_cleaned} new chunks, wrote {args.clean} and '
+          f'{args.states}')
@@ -0,0 +1,121 @@
+import os
+import json
+import fcntl
+import hashlib
+import logging
+
+import flask
+
+logger = logging.getLogger(__name__)
+# Bump when the bundle format or how responses are rendered changes in a way
+# the hashed files don't show
+BUNDLE_VERSION = 2
+
+def source_hash(*paths):
+    '''
+    Hash of BUNDLE_VERSION and the files a bundle is rendered from, the data
+    and the code that draws it. A bundle is only installed next to the same
+    ones, changing either makes it stale
+    '''
+    digest = hashlib.blake2b(str(BUNDLE_VERSION).encode('utf-8'),
+                             digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def render_bundle(app, calls, keys):
+    '''
+    Runs every registered callback in calls once and keeps its serialized
+    response.
+
+    calls is {callback_id: [args, ...]} and keys is {callback_id: key
+    function}, the key function boils a callback's args down to what the
+    output actually depends on.
+
+    Returns {callback_id: {json key: response body}}
+    '''
+    bundle = {}
+    for callback_id, arg_list in calls.items():
+        callback = app.callback_map[callback_id]['callback']
+        key = keys[callback_id]
+        bundle[callback_id] = {
+            json.dumps(key(*args)): callback(*args).get_data(as_text=True)
+            for args in arg_list
+        }
+    return bundle
+
+def write_bundle(bundle, path, source):
+    '''
+    Writes the bundle as one json file along with the source_hash of the
+    data it was rendered from, renamed into place so a worker starting
+    mid-deploy never reads half of it
+    '''
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'w') as f:
+        json.dump({'source': source, 'callbacks': bundle}, f)
+    os.replace(tmp, path)
+
+def read_bundle(path, source):
+    '''
+    Returns the bundle at path if it was rendered from source, else None
+    '''
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(saved, dict) or saved.get('source') != source:
+        return None
+    return saved['callbacks']
+
+def ensure_bundle(app, path, calls, keys, source):
+    '''
+    Renders and writes the bundle unless the one at path was rendered from
+    source. Every gunicorn worker calls this on import, it runs under an
+    exclusive lock on {path}.lock so one worker renders and the others wait
+    and then read its bundle. Call it before install_bundle, the real
+    callbacks do the rendering
+    '''
+    if read_bundle(path, source) is not None:
+        return
+    with open(f'{path}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if read_bundle(path, source) is None:
+            write_bundle(render_bundle(app, calls, keys), path, source)
+
+def install_bundle(app, path, keys, source):
+    '''
+    Points each bundled callback at its precomputed responses. Dash's
+    dispatch looks callbacks up in app.callback_map, so swapping the entry
+    there skips both the figure code and Dash's json.dumps of the result.
+    Anything not in the bundle falls through to the real callback.
+
+    Returns False, and logs a warning, if there's no bundle rendered from
+    source to install
+    '''
+    bundle = read_bundle(path, source)
+    if bundle is None:
+        logger.warning('No figure bundle for this data at %s, bundled '
+                       'callbacks render on every request', path)
+        return False
+
+    for callback_id, responses in bundle.items():
+        if callback_id not in app.callback_map:
+            continue
+        entry = app.callback_map[callback_id]
+        entry['callback'] = bundled_callback(
+            responses, keys[callback_id], entry['callback'])
+    return True
+
+def bundled_callback(responses, key, fallback):
+    '''
+    Returns a stand-in for a Dash callback that serves responses from the
+    bundle
+    '''
+    def callback(*args):
+        body = responses.get(json.dumps(key(*args)))
+        if body is None:
+            return fallback(*args)
+        return flask.Response(body, mimetype='application/json')
+    return callback
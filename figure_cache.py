@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from functools import wraps
+from collections import OrderedDict, defaultdict
+
+from plotly.utils import PlotlyJSONEncoder
+
+class MemoryBackend:
+    '''
+    Bounded in-process dict with least recently used eviction
+    '''
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+class DiskBackend:
+    '''
+    One json file per entry in a directory every gunicorn worker can see.
+    A hit bumps the file's mtime, so evicting the oldest mtimes is LRU.
+
+    Evicting means listing and stat'ing the whole directory, so it's only
+    done every evict_every writes (a tenth of maxsize by default) instead of
+    on each one. The directory can go over maxsize by that many entries per
+    worker in between
+    '''
+    def __init__(self, path, maxsize=1024, evict_every=None):
+        self.path = path
+        self.maxsize = maxsize
+        self.evict_every = evict_every or max(1, maxsize // 10)
+        self.n_writes = 0
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def filename(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def get(self, key):
+        filename = self.filename(key)
+        try:
+            with open(filename) as f:
+                value = f.read()
+            os.utime(filename)
+        except FileNotFoundError:
+            # Could've been evicted by another worker between open and utime
+            return None
+        return value
+
+    def set(self, key, value):
+        # Write then rename so other workers never read half a file
+        tmp = f'{self.filename(key)}.tmp-{os.getpid()}'
+        with open(tmp, 'w') as f:
+            f.write(value)
+        os.replace(tmp, self.filename(key))
+        with self.lock:
+            self.n_writes += 1
+            due = self.n_writes >= self.evict_every
+            if due:
+                self.n_writes = 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.json'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        entries.sort()
+        for _, path in entries[:max(len(entries) - self.maxsize, 0)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return len([i for i in os.listdir(self.path) if i.endswith('.json')])
+
+class RedisBackend:
+    '''
+    Entries in a Redis (or anything that speaks its protocol) shared by all
+    workers. A sorted set of last access times does the LRU bookkeeping
+    '''
+    def __init__(self, url, maxsize=4096, prefix='figure-cache:'):
+        # Optional dependency, only needed when this backend is picked
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.maxsize = maxsize
+        self.prefix = prefix
+        self.recency = prefix + 'recency'
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        self.client.zadd(self.recency, {key: time.time()})
+        return value.decode('utf-8')
+
+    def set(self, key, value):
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, value)
+        pipe.zadd(self.recency, {key: time.time()})
+        pipe.execute()
+        n_evict = self.client.zcard(self.recency) - self.maxsize
+        if n_evict > 0:
+            oldest = self.client.zrange(self.recency, 0, n_evict - 1)
+            pipe = self.client.pipeline()
+            pipe.delete(*[self.prefix + i.decode('utf-8') for i in oldest])
+            pipe.zrem(self.recency, *oldest)
+            pipe.execute()
+
+    def __len__(self):
+        return self.client.zcard(self.recency)
+
+def make_backend(spec, maxsize):
+    '''
+    Returns the shared backend described by spec, or None for memory only.
+
+    spec is either:
+        * 'disk:/some/dir'
+        * 'redis://host:port/db'
+    '''
+    if not spec:
+        return None
+    if spec.startswith('disk:'):
+        return DiskBackend(spec[len('disk:'):], maxsize)
+    if spec.startswith('redis://'):
+        return RedisBackend(spec, maxsize)
+    raise ValueError(f'Unknown figure cache backend: {spec}')
+
+def freeze(value):
+    '''
+    Turns callback inputs (lists, dicts) into something hashable
+    '''
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(i) for i in value)
+    return value
+
+class FigureCache:
+    '''
+    Memoizes callback outputs keyed on their inputs.
+
+    Every worker keeps a small LRU of its own in memory. If a shared backend
+    is given, misses there fall back to it and new entries get written to it
+    (as json), so one worker's render can be served by all of them.
+
+    Hits/misses are counted per callback, see stats. gunicorn's threads
+    share the counts, they're updated under the memory LRU's lock.
+    '''
+    def __init__(self, maxsize=256, shared=None):
+        self.memory = MemoryBackend(maxsize)
+        self.shared = shared
+        self.counts = defaultdict(lambda: {'hits': 0, 'shared_hits': 0,
+                                           'misses': 0})
+
+    def memoize(self, key=None):
+        '''
+        Decorator for a callback. key is an optional function that takes the
+        callback's arguments and returns what actually matters about them,
+        e.g. just the state name out of a hoverData dict
+        '''
+        def decorator(func):
+            name = func.__name__
+
+            @wraps(func)
+            def wrapper(*args):
+                args_key = key(*args) if key is not None else args
+                cache_key = (name, freeze(args_key))
+
+                value = self.memory.get(cache_key)
+                if value is not None:
+                    self.count(name, 'hits')
+                    return value
+
+                if self.shared is not None:
+                    shared_key = hashlib.sha1(
+                        repr(cache_key).encode('utf-8')).hexdigest()
+                    value = self.shared.get(shared_key)
+                    if value is not None:
+                        self.count(name, 'shared_hits')
+                        value = json.loads(value)
+                        self.memory.set(cache_key, value)
+                        return value
+
+                self.count(name, 'misses')
+                value = func(*args)
+                self.memory.set(cache_key, value)
+                if self.shared is not None:
+                    self.shared.set(
+                        shared_key, json.dumps(value, cls=PlotlyJSONEncoder))
+                return value
+            return wrapper
+        return decorator
+
+    def count(self, name, result):
+        with self.memory.lock:
+            self.counts[name][result] += 1
+
+    def stats(self):
+        '''
+        Returns {callback name: {'hits': n, 'shared_hits': n, 'misses': n}}
+        '''
+        with self.memory.lock:
+            return {name: dict(counts) for name, counts in self.counts.items()}
@@ -0,0 +1,206 @@
+import time
+import zlib
+import sqlite3
+import threading
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_PATH = 'data/geocode_cache.db'
+
+class Location(NamedTuple):
+    '''
+    What a geocoder hands back, same attribute names as geopy's Location
+    '''
+    latitude: float
+    longitude: float
+
+def normalize(query):
+    '''
+    Cache key of a query: lower case, commas and runs of spaces squashed,
+    so "Springfield,  Illinois" and "springfield illinois" are one entry
+    '''
+    return ' '.join(query.lower().replace(',', ' ').split())
+
+class GeocodeCache:
+    '''
+    SQLite table of normalized query -> (lat, lon). Queries the geocoder
+    found nothing for are kept too (lat/lon NULL) so they aren't asked
+    again. Several processes can share the file
+    '''
+    def __init__(self, path=CACHE_PATH):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS geocodes ('
+                        'query TEXT PRIMARY KEY, lat REAL, lon REAL, '
+                        'updated REAL)')
+        self.db.commit()
+
+    def get_many(self, keys):
+        '''
+        Returns {key: Location or None (known to not exist)} of the keys in
+        the cache, missing keys aren't in the dict
+        '''
+        found = {}
+        keys = list(keys)
+        with self.lock:
+            # Stay under SQLite's limit on query parameters
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self.db.execute(
+                    'SELECT query, lat, lon FROM geocodes WHERE query IN '
+                    f'({",".join("?" * len(batch))})', batch)
+                for key, lat, lon in rows:
+                    found[key] = None if lat is None else Location(lat, lon)
+        return found
+
+    def put_many(self, locations):
+        '''
+        Stores {key: Location or None}
+        '''
+        now = time.time()
+        rows = [(key, None, None, now) if location is None else
+                (key, location.latitude, location.longitude, now)
+                for key, location in locations.items()]
+        with self.lock:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?)', rows)
+            self.db.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM geocodes').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class StubGeocoder:
+    '''
+    Offline stand in for Nominatim. Queries in `places` get their location,
+    any other query gets a made up one somewhere in the lower 48 that's the
+    same every time (from a crc of the normalized query). Queries with
+    "nowhere" in them aren't found. `latency` seconds of sleep per call to
+    act like a network
+    '''
+    def __init__(self, places=None, latency=0.0):
+        self.places = {normalize(query): Location(*location)
+                       for query, location in (places or {}).items()}
+        self.latency = latency
+        self.n_calls = 0
+        self.lock = threading.Lock()
+
+    def geocode(self, query):
+        with self.lock:
+            self.n_calls += 1
+        time.sleep(self.latency)
+        key = normalize(query)
+        if key in self.places:
+            return self.places[key]
+        if 'nowhere' in key:
+            return None
+        crc = zlib.crc32(key.encode('utf-8'))
+        return Location(round(25 + (crc % 2400) / 100, 4),
+                        round(-124 + (crc // 2400 % 5700) / 100, 4))
+
+def make_geocoder(name):
+    '''
+    'nominatim' (geopy, imported only then) or 'stub'
+    '''
+    if name == 'stub':
+        return StubGeocoder()
+    if name == 'nominatim':
+        from geopy.geocoders import Nominatim
+        return Nominatim(user_agent='my-application', timeout=2)
+    raise ValueError(f'Unknown geocoder {name!r}, use nominatim or stub')
+
+class Resolver:
+    '''
+    Geocodes batches of queries through the GeocodeCache.
+
+    resolve dedupes the batch by normalized query, answers what it can from
+    the cache and sends only the misses to the geocoder, `concurrency` at a
+    time and at most `rate` a second (Nominatim's policy is 1/s). Answers,
+    including not found, go into the cache; errors (timeouts etc.) don't,
+    so those get another go next time. offline=True never calls the
+    geocoder, misses just come back as None.
+
+    geocoder is a geocoder object or the name of one (see make_geocoder),
+    a name is only made into one once there's a miss to look up.
+    '''
+    def __init__(self, geocoder=None, cache=None, concurrency=4, rate=1.0,
+                 offline=False):
+        self.geocoder = geocoder
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.concurrency = concurrency
+        self.rate = rate
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.next_call = 0
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_errors = 0
+
+    def wait_turn(self):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            turn = max(now, self.next_call)
+            self.next_call = turn + 1 / self.rate
+        time.sleep(turn - now)
+
+    def lookup(self, query):
+        self.wait_turn()
+        try:
+            return self.geocoder.geocode(query), True
+        except Exception:
+            return None, False
+
+    def resolve(self, queries):
+        '''
+        Returns {query: Location or None} for every query in queries
+        '''
+        keys = {query: normalize(query) for query in set(queries)}
+        # One original spelling per key to send to the geocoder
+        spelling = {key: query for query, key in keys.items()}
+        found = self.cache.get_many(spelling)
+        misses = [key for key in spelling if key not in found]
+        self.n_hits += len(found)
+        self.n_misses += len(misses)
+
+        if misses and not self.offline:
+            if self.geocoder is None or isinstance(self.geocoder, str):
+                self.geocoder = make_geocoder(self.geocoder or 'nominatim')
+            with ThreadPoolExecutor(self.concurrency) as pool:
+                answers = pool.map(lambda key: self.lookup(spelling[key]),
+                                   misses)
+                fresh = {}
+                for key, (location, ok) in zip(misses, answers):
+                    if ok:
+                        fresh[key] = None if location is None else \
+                            Location(location.latitude, location.longitude)
+                    else:
+                        self.n_errors += 1
+            self.cache.put_many(fresh)
+            found.update(fresh)
+
+        return {query: found.get(key) for query, key in keys.items()}
+
+    def report(self):
+        return (f'{self.n_hits} cached, {self.n_misses} misses, '
+                f'{self.n_errors} errors')
+
+# One Resolver per process and settings, for the cleaning workers
+resolvers = {}
+
+def resolver(cache_path=CACHE_PATH, geocoder='nominatim', offline=False,
+             rate=1.0):
+    '''
+    Returns this process' Resolver for these settings, made on first use
+    '''
+    key = (cache_path, geocoder, offline, rate)
+    if key not in resolvers:
+        resolvers[key] = Resolver(geocoder, GeocodeCache(cache_path),
+                                  rate=rate, offline=offline)
+    return resolvers[key]
@@ -0,0 +1,426 @@
+import os
+import sys
+import glob
+import json
+import fcntl
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+STORE_VERSION = 4
+CSV_PATH = 'data/gun_violence_clean.csv'
+STORE_PATH = 'data/incident_store'
+# Side of a spatial index grid cell in degrees
+SPATIAL_CELL = 0.25
+
+def build_store(csv_path=CSV_PATH, store_path=STORE_PATH):
+    '''
+    Reads the cleaned incident csv once and writes it out as a directory of
+    NumPy columns that can be memory-mapped by every app worker.
+
+    Column layouts:
+        * numeric  - {col}.npy, same dtype pandas read it as
+        * date     - {col}.npy as datetime64[D]
+        * category - {col}.npy of int16 codes (-1 is missing), the labels live
+                     in meta.json. Used for repetitive strings like state
+        * text     - {col}.data.npy is all the utf-8 bytes glued together and
+                     {col}.offsets.npy is where each row starts/ends. Missing
+                     values are stored as empty strings
+
+    On top of the columns it writes a year column, the (state, year)
+    partition index (see build_partitions), the lat/lon grid index (see
+    build_spatial_index) and id_index.npy, a dense incident_id -> row
+    position array (-1 where there's no incident) so looking up one
+    incident is a single array read.
+
+    store_path ends up a symlink to a directory named after the csv it was
+    built from (see source_key). The store is written to a temp dir, renamed
+    to that name and the symlink swapped over to it in one rename, so
+    readers see the old store or the new one, never half of one. Run it
+    under ensure_store's lock when other processes might build too.
+    '''
+    source = source_stat(csv_path)
+    df = pd.read_csv(csv_path)
+    df = df.sort_values('incident_id').reset_index(drop=True)
+    df['date'] = pd.to_datetime(df['date'])
+    df['year'] = df['date'].dt.year.astype(np.int16)
+
+    tmp_path = f'{store_path}.tmp-{os.getpid()}'
+    os.makedirs(tmp_path)
+
+    meta = {'version': STORE_VERSION, 'source': source, 'n_rows': len(df),
+            'columns': {}}
+    for col in df.columns:
+        series = df[col]
+        if col == 'date':
+            col_meta = {'kind': 'date'}
+            np.save(f'{tmp_path}/{col}.npy',
+                    series.values.astype('datetime64[D]'))
+        elif pd.api.types.is_numeric_dtype(series):
+            col_meta = {'kind': 'numeric'}
+            np.save(f'{tmp_path}/{col}.npy', series.values)
+        elif is_categorical(series):
+            codes, labels = pd.factorize(series, sort=True)
+            col_meta = {'kind': 'category', 'categories': list(labels)}
+            np.save(f'{tmp_path}/{col}.npy', codes.astype(np.int16))
+        else:
+            col_meta = {'kind': 'text'}
+            data, offsets = encode_text(series)
+            np.save(f'{tmp_path}/{col}.data.npy', data)
+            np.save(f'{tmp_path}/{col}.offsets.npy', offsets)
+        meta['columns'][col] = col_meta
+
+    states = np.load(f'{tmp_path}/state.npy')
+    order, offsets = build_partitions(states, df['year'].values)
+    np.save(f'{tmp_path}/partition_order.npy', order)
+    np.save(f'{tmp_path}/partition_offsets.npy', offsets)
+    meta['partition_years'] = [int(df['year'].min()), int(df['year'].max())]
+
+    ids = df['incident_id'].values
+    id_index = np.full(ids.max() + 1, -1, dtype=np.int32)
+    id_index[ids] = np.arange(len(ids), dtype=np.int32)
+    np.save(f'{tmp_path}/id_index.npy', id_index)
+
+    keys, order = build_spatial_index(df['latitude'].values,
+                                      df['longitude'].values, SPATIAL_CELL)
+    np.save(f'{tmp_path}/spatial_keys.npy', keys)
+    np.save(f'{tmp_path}/spatial_order.npy', order)
+    meta['spatial_cell'] = SPATIAL_CELL
+
+    with open(f'{tmp_path}/meta.json', 'w') as f:
+        json.dump(meta, f)
+
+    built_path = f'{store_path}.{source_key(source)}'
+    if os.path.isdir(built_path):
+        shutil.rmtree(built_path)
+    os.rename(tmp_path, built_path)
+    swap_link(built_path, store_path)
+
+def source_stat(csv_path):
+    '''
+    The size and mtime of the csv a store is built from, kept in meta.json
+    to tell when the csv changed under it
+    '''
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def source_key(source):
+    '''
+    Short name for a store version built from a source_stat
+    '''
+    key = json.dumps([STORE_VERSION, source], sort_keys=True).encode('utf-8')
+    return f'v{STORE_VERSION}-' + hashlib.blake2b(key, digest_size=6).hexdigest()
+
+def swap_link(built_path, store_path):
+    '''
+    Points the store_path symlink at built_path and removes the store
+    versions it pointed at before. Workers that already opened an old one
+    keep their mmaps, the files only go once they're unmapped
+    '''
+    link_path = f'{store_path}.link-{os.getpid()}'
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.symlink(os.path.basename(built_path), link_path)
+    # A store from before the symlinks is a plain directory, the rename
+    # can't replace that
+    if os.path.isdir(store_path) and not os.path.islink(store_path):
+        shutil.rmtree(store_path)
+    os.replace(link_path, store_path)
+    for path in glob.glob(f'{glob.escape(store_path)}.v*'):
+        if path != built_path and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+def build_partitions(states, years):
+    '''
+    Groups row positions by (state, year) so a callback can grab exactly the
+    rows it needs without scanning the whole table.
+
+    Returns:
+        * order   - int32 row positions sorted by state code, then year. The
+                    sort is stable so each partition stays in incident_id
+                    order
+        * offsets - partition k = state_code * n_years + (year - first_year)
+                    is order[offsets[k]:offsets[k + 1]]
+
+    Rows without a state aren't in any partition.
+    '''
+    first_year = int(years.min())
+    n_years = int(years.max()) - first_year + 1
+    n_states = int(states.max()) + 1
+
+    valid = np.flatnonzero(states >= 0)
+    keys = states[valid].astype(np.int64) * n_years + (years[valid] - first_year)
+    sort = np.argsort(keys, kind='mergesort')
+    order = valid[sort].astype(np.int32)
+    offsets = np.searchsorted(keys[sort], np.arange(n_states * n_years + 1))
+    return order, offsets.astype(np.int64)
+
+def cell_keys(lat, lon, cell):
+    '''
+    Returns the grid cell number of each lat/lon. Cells are numbered a row
+    (band of latitude) at a time, so any run of cells within one row has
+    consecutive numbers
+    '''
+    n_cols = int(np.ceil(360 / cell)) + 1
+    rows = np.floor((lat + 90) / cell).astype(np.int64)
+    cols = np.floor((lon + 180) / cell).astype(np.int64)
+    return rows * n_cols + cols
+
+def build_spatial_index(lat, lon, cell):
+    '''
+    Grid index over every incident with a location.
+
+    Returns:
+        * keys  - sorted int64 cell number of each located incident
+        * order - int32 row positions in the same order as keys
+
+    So the incidents in any run of cells are a contiguous slice of order,
+    found with a binary search on keys
+    '''
+    valid = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+    keys = cell_keys(lat[valid], lon[valid], cell)
+    sort = np.argsort(keys, kind='mergesort')
+    return keys[sort], valid[sort].astype(np.int32)
+
+def is_categorical(series):
+    '''
+    Strings are dictionary encoded when each value repeats on average at
+    least 4 times and the labels fit in an int16
+    '''
+    n_unique = series.nunique()
+    return n_unique < np.iinfo(np.int16).max and n_unique * 4 <= len(series)
+
+def encode_text(series):
+    '''
+    Returns the (data, offsets) pair for a text column
+    '''
+    encoded = [i.encode('utf-8') if type(i) == str else b''
+               for i in series.values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(i) for i in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return data, offsets
+
+def store_current(csv_path, store_path):
+    '''
+    Whether store_path holds a store of this version built from the csv as
+    it is now. Without the csv whatever store there is counts
+    '''
+    try:
+        with open(f'{store_path}/meta.json') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if meta.get('version') != STORE_VERSION:
+        return False
+    return not os.path.isfile(csv_path) or \
+        meta.get('source') == source_stat(csv_path)
+
+def ensure_store(csv_path=CSV_PATH, store_path=STORE_PATH):
+    '''
+    Builds the store if it isn't there yet, is from an older version or the
+    csv changed since. Every gunicorn worker calls this on import, so the
+    check and build happen under an exclusive lock on {store_path}.lock:
+    the first worker builds and the rest wait for it and find the store
+    current
+    '''
+    if store_current(csv_path, store_path):
+        return
+    os.makedirs(os.path.dirname(store_path) or '.', exist_ok=True)
+    with open(f'{store_path}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not store_current(csv_path, store_path):
+            build_store(csv_path, store_path)
+
+class IncidentStore:
+    '''
+    Read only view over a store written by build_store. Every column is
+    opened with mmap_mode='r' so the pages live in the OS page cache and are
+    shared between processes instead of being copied into each one.
+
+    Rows are sorted by incident_id. Rows for a single (state, year) come from
+    partition instead of scanning the state column.
+    '''
+    def __init__(self, store_path=STORE_PATH):
+        # Resolve the symlink once so every file comes from the same build
+        # even if it gets swapped while this is loading
+        self.path = os.path.realpath(store_path)
+        with open(f'{self.path}/meta.json') as f:
+            meta = json.load(f)
+        if meta['version'] != STORE_VERSION:
+            raise ValueError(f'{store_path} is store version '
+                             f'{meta["version"]}, expected {STORE_VERSION}')
+        self.n_rows = meta['n_rows']
+        self.kinds = {col: i['kind'] for col, i in meta['columns'].items()}
+        self.categories = {col: i['categories']
+                           for col, i in meta['columns'].items()
+                           if i['kind'] == 'category'}
+        self.codes = {col: {label: code for code, label in enumerate(labels)}
+                      for col, labels in self.categories.items()}
+        self.arrays = {}
+        for col, kind in self.kinds.items():
+            if kind == 'text':
+                self.arrays[col] = (self.load(f'{col}.data'),
+                                    self.load(f'{col}.offsets'))
+            else:
+                self.arrays[col] = self.load(col)
+        self.first_year, self.last_year = meta['partition_years']
+        self.partition_order = self.load('partition_order')
+        self.partition_offsets = self.load('partition_offsets')
+        self.id_index = self.load('id_index')
+        self.spatial_cell = meta['spatial_cell']
+        self.spatial_keys = self.load('spatial_keys')
+        self.spatial_order = self.load('spatial_order')
+
+    def load(self, name):
+        return np.load(f'{self.path}/{name}.npy', mmap_mode='r')
+
+    def __len__(self):
+        return self.n_rows
+
+    @property
+    def columns(self):
+        return list(self.kinds)
+
+    def column(self, col):
+        '''
+        Returns the raw mmapped array of a column (codes for categories).
+        Text columns don't have a single array, use text/values for those
+        '''
+        if self.kinds[col] == 'text':
+            raise KeyError(f'{col} is a text column')
+        return self.arrays[col]
+
+    def encode(self, col, label):
+        '''
+        Returns the int code of a category label, -1 if it never shows up
+        '''
+        return self.codes[col].get(label, -1)
+
+    def partition(self, state, year):
+        '''
+        Returns the row positions of every incident in the state and year.
+        It's a slice of the mmapped partition index, so nothing gets copied
+        '''
+        code = self.encode('state', state)
+        if code < 0 or not self.first_year <= year <= self.last_year:
+            return self.partition_order[:0]
+        n_years = self.last_year - self.first_year + 1
+        k = code * n_years + (year - self.first_year)
+        start, end = self.partition_offsets[k], self.partition_offsets[k + 1]
+        return self.partition_order[start:end]
+
+    def within(self, bounds):
+        '''
+        Returns the row positions of every incident inside the
+        (lat_min, lat_max, lon_min, lon_max) bounds, across state lines.
+
+        Each row of grid cells the box covers is one binary search on the
+        spatial index, only the cells on the edge of the box need their
+        points checked one by one
+        '''
+        lat_min, lat_max, lon_min, lon_max = bounds
+        lat_min, lat_max = max(lat_min, -90), min(lat_max, 90)
+        lon_min, lon_max = max(lon_min, -180), min(lon_max, 180)
+        if lat_min > lat_max or lon_min > lon_max:
+            return self.spatial_order[:0]
+
+        cell = self.spatial_cell
+        n_cols = int(np.ceil(360 / cell)) + 1
+        row_lo, row_hi = [int(np.floor((i + 90) / cell))
+                          for i in (lat_min, lat_max)]
+        col_lo, col_hi = [int(np.floor((i + 180) / cell))
+                          for i in (lon_min, lon_max)]
+        band = np.arange(row_lo, row_hi + 1, dtype=np.int64) * n_cols
+        starts = np.searchsorted(self.spatial_keys, band + col_lo, 'left')
+        ends = np.searchsorted(self.spatial_keys, band + col_hi, 'right')
+        rows = np.concatenate([self.spatial_order[start:end]
+                               for start, end in zip(starts, ends)])
+
+        lat = self.arrays['latitude'][rows]
+        lon = self.arrays['longitude'][rows]
+        inside = (lat >= lat_min) & (lat <= lat_max) & \
+                 (lon >= lon_min) & (lon <= lon_max)
+        return rows[inside]
+
+    def text(self, col, pos):
+        '''
+        Returns the string in a text column at one row position, None if it
+        was missing
+        '''
+        data, offsets = self.arrays[col]
+        start, end = offsets[pos], offsets[pos + 1]
+        if start == end:
+            return None
+        return bytes(data[start:end]).decode('utf-8')
+
+    def values(self, col, rows):
+        '''
+        Returns the decoded values of a column for an array of row positions
+        '''
+        kind = self.kinds[col]
+        if kind == 'text':
+            return np.array([self.text(col, pos) for pos in rows],
+                            dtype=object)
+        values = self.arrays[col][rows]
+        if kind == 'category':
+            labels = np.array(self.categories[col] + [None], dtype=object)
+            return labels[values]
+        return values
+
+    def frame(self, rows, columns=None):
+        '''
+        Returns a pandas df of only the requested rows/columns, indexed by
+        incident_id like the old csv load was
+        '''
+        rows = np.asarray(rows)
+        if columns is None:
+            columns = [col for col in self.columns if col != 'incident_id']
+        data = {col: self.values(col, rows) for col in columns}
+        index = pd.Index(self.arrays['incident_id'][rows], name='incident_id')
+        return pd.DataFrame(data=data, index=index, columns=columns)
+
+    def position(self, incident_id):
+        '''
+        Returns the row position of an incident_id, raises KeyError if it
+        isn't in the store
+        '''
+        if not 0 <= incident_id < len(self.id_index):
+            raise KeyError(incident_id)
+        pos = int(self.id_index[incident_id])
+        if pos < 0:
+            raise KeyError(incident_id)
+        return pos
+
+    def record(self, incident_id, columns=None):
+        '''
+        Returns a dict of the columns (all by default) for one incident.
+        Dates come back as pd.Timestamps and missing values as None. A
+        column with nothing in it at all is stored as float, its NaNs come
+        back as None too so the record can go straight to json
+        '''
+        pos = self.position(incident_id)
+        if columns is None:
+            columns = self.columns
+        record = {}
+        for col in columns:
+            kind = self.kinds[col]
+            if kind == 'text':
+                record[col] = self.text(col, pos)
+            elif kind == 'date':
+                record[col] = pd.Timestamp(self.arrays[col][pos])
+            elif kind == 'category':
+                code = self.arrays[col][pos]
+                record[col] = self.categories[col][code] if code >= 0 else None
+            else:
+                value = self.arrays[col][pos].item()
+                record[col] = None if value != value else value
+        return record
+
+if __name__ == '__main__':
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else CSV_PATH
+    store_path = sys.argv[2] if len(sys.argv) > 2 else STORE_PATH
+    ensure_store(csv_path, store_path)
+    print(f'{store_path} has {len(IncidentStore(store_path))} incidents')
@@ -0,0 +1,101 @@
+import math
+
+import numpy as np
+
+# Rough size of the incident map in pixels. The graph is 450px tall and
+# ~70% of 85vw wide, the width only has to be in the right ballpark
+MAP_WIDTH = 1000
+MAP_HEIGHT = 450
+# Mapbox GL draws 512px tiles, so the world is 512 * 2**zoom pixels wide
+TILE_SIZE = 512
+# Grid cells are this many pixels across at the zoom they're built for
+CELL_PX = 48
+MIN_LEVEL = 3
+MAX_LEVEL = 14
+
+def view_key(relayoutData):
+    '''
+    Returns (lat, lon, zoom) of the view the user panned/zoomed the map to,
+    None if relayoutData doesn't have one (first load, autosize, etc)
+
+    Depending on the plotly.js version mapbox relayouts come through as
+    either {'mapbox': {'center': ..., 'zoom': ...}} or flattened
+    {'mapbox.center': ..., 'mapbox.zoom': ...}
+    '''
+    if type(relayoutData) != dict:
+        return None
+    if type(relayoutData.get('mapbox')) == dict:
+        center = relayoutData['mapbox'].get('center')
+        zoom = relayoutData['mapbox'].get('zoom')
+    else:
+        center = relayoutData.get('mapbox.center')
+        zoom = relayoutData.get('mapbox.zoom')
+    if center is None or zoom is None:
+        return None
+    return center['lat'], center['lon'], zoom
+
+def viewport(lat, lon, zoom, padding=1.25):
+    '''
+    Returns a dict with the center, zoom, grid level and the
+    (lat_min, lat_max, lon_min, lon_max) bounds visible at that view,
+    padded a bit so small pans don't show empty edges
+    '''
+    deg_per_px = 360 / (TILE_SIZE * 2 ** zoom)
+    half_lon = MAP_WIDTH / 2 * deg_per_px * padding
+    # Mercator squashes latitude degrees together away from the equator
+    half_lat = MAP_HEIGHT / 2 * deg_per_px * padding * \
+        math.cos(math.radians(lat))
+    return {
+        'center': {'lat': lat, 'lon': lon},
+        'zoom': zoom,
+        'level': min(max(int(zoom), MIN_LEVEL), MAX_LEVEL),
+        'bounds': (lat - half_lat, lat + half_lat,
+                   lon - half_lon, lon + half_lon),
+    }
+
+def in_bounds(lat, lon, bounds):
+    '''
+    Returns a boolean mask of the points inside the bounds
+    '''
+    lat_min, lat_max, lon_min, lon_max = bounds
+    return (lat >= lat_min) & (lat <= lat_max) & \
+           (lon >= lon_min) & (lon <= lon_max)
+
+def cell_size(level):
+    '''
+    Returns the width of a grid cell in degrees at a zoom level
+    '''
+    return CELL_PX * 360 / (TILE_SIZE * 2 ** level)
+
+def grid_clusters(lat, lon, level):
+    '''
+    Snaps points to a square grid sized for the zoom level and collapses
+    each occupied cell into one cluster.
+
+    Returns (lat, lon, count) arrays, one entry per cluster, placed at the
+    mean position of its points rather than the middle of the cell
+    '''
+    keep = ~(np.isnan(lat) | np.isnan(lon))
+    lat, lon = lat[keep], lon[keep]
+    if len(lat) == 0:
+        return lat, lon, np.zeros(0, dtype=np.int64)
+
+    size = cell_size(level)
+    rows = np.floor(lat / size).astype(np.int64)
+    cols = np.floor(lon / size).astype(np.int64)
+    # One int per cell, offset so negative longitudes stay unique
+    n_cols = int(math.ceil(360 / size)) + 1
+    cells = rows * n_cols + (cols + n_cols // 2)
+
+    _, cluster, count = np.unique(cells, return_inverse=True,
+                                  return_counts=True)
+    cluster = cluster.ravel()
+    cluster_lat = np.bincount(cluster, weights=lat) / count
+    cluster_lon = np.bincount(cluster, weights=lon) / count
+    return cluster_lat, cluster_lon, count
+
+def cluster_sizes(count, min_size=8, max_size=30):
+    '''
+    Returns marker sizes that grow with the log of each cluster's count
+    '''
+    return np.clip(min_size + 3 * np.log2(count), min_size, max_size).round(1)
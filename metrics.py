@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import threading
+from functools import wraps
+from collections import Counter, defaultdict
+
+# Upper bounds in seconds of the callback latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# The profiler stops counting new stacks past this many, old ones still count
+MAX_STACKS = 20000
+
+def label(value):
+    '''
+    Escapes a Prometheus label value
+    '''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+class CallbackMetrics:
+    '''
+    Per-callback counters for a Dash app, served as Prometheus text.
+
+    instrument wraps every callback in app.callback_map, the same way
+    figure_bundle swaps them, so the wall time and response bytes include
+    Dash's serialization and bundled responses. Inside a callback, count
+    adds the rows it scanned and the traces it built to the request being
+    timed.
+
+    Every gunicorn worker keeps its own counters, so each scrape of
+    /metrics sees one worker's.
+
+    With profile_interval set (seconds), a background thread samples the
+    stacks of threads that are inside a callback every profile_interval and
+    counts them, see folded_stacks
+    '''
+    def __init__(self, profile_interval=None):
+        self.lock = threading.Lock()
+        self.stats = defaultdict(lambda: {
+            'calls': 0, 'errors': 0, 'seconds': 0.0,
+            'buckets': [0] * len(BUCKETS), 'rows': 0, 'traces': 0,
+            'bytes': 0,
+        })
+        self.local = threading.local()
+        # thread id -> callback it's running, for the profiler
+        self.active = {}
+        self.stacks = Counter()
+        self.wrapper_codes = set()
+        self.profile_interval = profile_interval
+        if profile_interval:
+            threading.Thread(target=self.sample_stacks, daemon=True).start()
+
+    def instrument(self, app):
+        '''
+        Wraps every registered callback. Call it once every callback is
+        registered (and any bundle installed)
+        '''
+        for output, entry in app.callback_map.items():
+            entry['callback'] = self.timed(output, entry['callback'])
+
+    def timed(self, output, callback):
+        '''
+        Returns callback wrapped to record a request under output
+        '''
+        @wraps(callback)
+        def wrapper(*args):
+            self.local.counts = counts = {'rows': 0, 'traces': 0}
+            ident = threading.get_ident()
+            self.active[ident] = output
+            start = time.perf_counter()
+            try:
+                response = callback(*args)
+            except Exception:
+                self.record(output, time.perf_counter() - start, counts, 0,
+                            error=True)
+                raise
+            finally:
+                self.active.pop(ident, None)
+                self.local.counts = None
+            size = len(response.get_data()) \
+                if hasattr(response, 'get_data') else 0
+            self.record(output, time.perf_counter() - start, counts, size)
+            return response
+        self.wrapper_codes.add(wrapper.__code__)
+        return wrapper
+
+    def count(self, rows=0, traces=0):
+        '''
+        Adds to the rows scanned/traces built by the callback this thread is
+        running. Does nothing outside an instrumented callback
+        '''
+        counts = getattr(self.local, 'counts', None)
+        if counts is None:
+            return
+        counts['rows'] += rows
+        counts['traces'] += traces
+
+    def record(self, output, seconds, counts, size, error=False):
+        with self.lock:
+            stats = self.stats[output]
+            stats['calls'] += 1
+            stats['errors'] += error
+            stats['seconds'] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+            stats['rows'] += counts['rows']
+            stats['traces'] += counts['traces']
+            stats['bytes'] += size
+
+    def sample_stacks(self):
+        '''
+        The profiler thread. Only the part of each stack under the
+        instrumented wrapper is kept, keyed by the callback it's in
+        '''
+        while True:
+            time.sleep(self.profile_interval)
+            frames = sys._current_frames()
+            for ident, output in list(self.active.items()):
+                frame = frames.get(ident)
+                names = []
+                while frame is not None and \
+                        frame.f_code not in self.wrapper_codes:
+                    code = frame.f_code
+                    names.append(f'{code.co_name} '
+                                 f'({os.path.basename(code.co_filename)}:'
+                                 f'{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack = ';'.join([output] + names[::-1])
+                with self.lock:
+                    if stack in self.stacks or len(self.stacks) < MAX_STACKS:
+                        self.stacks[stack] += 1
+
+    def folded_stacks(self):
+        '''
+        Returns the profiler's samples as folded stacks, one "a;b;c count"
+        line each, what flamegraph.pl and speedscope read
+        '''
+        with self.lock:
+            stacks = self.stacks.most_common()
+        return ''.join(f'{stack} {n}\n' for stack, n in stacks)
+
+    def prometheus(self, cache_stats=None):
+        '''
+        Returns the counters in Prometheus' text format. cache_stats is
+        FigureCache.stats(), its counts are keyed by callback function name
+        '''
+        with self.lock:
+            stats = {output: dict(s, buckets=list(s['buckets']))
+                     for output, s in self.stats.items()}
+
+        lines = [
+            '# HELP gv_callback_seconds Wall time of Dash callbacks, '
+            'serialization included',
+            '# TYPE gv_callback_seconds histogram',
+        ]
+        for output, s in sorted(stats.items()):
+            name = label(output)
+            for bound, n in zip(BUCKETS, s['buckets']):
+                lines.append(f'gv_callback_seconds_bucket{{callback="{name}",'
+                             f'le="{bound}"}} {n}')
+            lines.append(f'gv_callback_seconds_bucket{{callback="{name}",'
+                         f'le="+Inf"}} {s["calls"]}')
+            lines.append(f'gv_callback_seconds_sum{{callback="{name}"}} '
+                         f'{s["seconds"]:.6f}')
+            lines.append(f'gv_callback_seconds_count{{callback="{name}"}} '
+                         f'{s["calls"]}')
+
+        for metric, key, help_text in [
+                ('gv_callback_errors_total', 'errors',
+                 'Dash callbacks that raised'),
+                ('gv_callback_rows_scanned_total', 'rows',
+                 'Incident/state rows callbacks looked at'),
+                ('gv_callback_traces_total', 'traces',
+                 'Plotly traces callbacks built'),
+                ('gv_callback_response_bytes_total', 'bytes',
+                 'Bytes of serialized callback responses')]:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for output, s in sorted(stats.items()):
+                lines.append(f'{metric}{{callback="{label(output)}"}} '
+                             f'{s[key]}')
+
+        if cache_stats:
+            lines.append('# HELP gv_figure_cache_requests_total Figure cache '
+                         'lookups by callback function and result')
+            lines.append('# TYPE gv_figure_cache_requests_total counter')
+            for name, counts in sorted(cache_stats.items()):
+                for result, n in sorted(counts.items()):
+                    lines.append(f'gv_figure_cache_requests_total{{callback='
+                                 f'"{label(name)}",result="{result}"}} {n}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+import time
+
+# Statuses an id can end up with
+DONE = 'done'
+MISSING = 'missing'
+FAILED = 'failed'
+
+class Checkpoint:
+    '''
+    Remembers which ids a scraper already got through, in a SQLite table so
+    a run that crashed or got stopped picks up where it left off.
+
+    Every id ends up DONE (we have its data), MISSING (404, nothing there) or
+    FAILED (gave up after the retries, error kept). pending skips DONE and
+    MISSING ids, FAILED ones get another go on the next run.
+
+    One database can hold the checkpoints of several scrapers, each gets its
+    own table (name). Marks are committed every `commit_every` ids or
+    seconds, whichever comes first, call commit/close at the end. Several
+    processes (shards) can share the file, it's in WAL mode.
+    '''
+    def __init__(self, path, name, commit_every=500, commit_seconds=5.0):
+        self.name = name
+        self.commit_every = commit_every
+        self.commit_seconds = commit_seconds
+        self.lock = threading.Lock()
+        self.n_marked = 0
+        self.last_commit = time.monotonic()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS "{name}" ('
+                        'id INTEGER PRIMARY KEY, status TEXT NOT NULL, '
+                        'error TEXT, updated REAL)')
+        self.db.commit()
+
+    def mark(self, idx, status, error=None):
+        self.mark_many([idx], status, error)
+
+    def mark_many(self, ids, status, error=None):
+        now = time.time()
+        rows = [(int(idx), status, error, now) for idx in ids]
+        with self.lock:
+            self.db.executemany(f'INSERT OR REPLACE INTO "{self.name}" '
+                                'VALUES (?, ?, ?, ?)', rows)
+            self.n_marked += len(rows)
+            if self.n_marked >= self.commit_every or \
+                    time.monotonic() - self.last_commit >= self.commit_seconds:
+                self._commit()
+
+    def commit(self):
+        with self.lock:
+            self._commit()
+
+    def _commit(self):
+        self.db.commit()
+        self.n_marked = 0
+        self.last_commit = time.monotonic()
+
+    def finished(self, lower, upper):
+        '''
+        Returns the set of DONE or MISSING ids between lower and upper
+        (inclusive)
+        '''
+        with self.lock:
+            rows = self.db.execute(
+                f'SELECT id FROM "{self.name}" WHERE id BETWEEN ? AND ? '
+                'AND status != ?', (int(lower), int(upper), FAILED))
+            return {idx for idx, in rows}
+
+    def statuses(self, lower, upper):
+        '''
+        Returns {id: status} of every id between lower and upper (inclusive)
+        the checkpoint has
+        '''
+        with self.lock:
+            return dict(self.db.execute(
+                f'SELECT id, status FROM "{self.name}" '
+                'WHERE id BETWEEN ? AND ?', (int(lower), int(upper))))
+
+    def pending(self, ids):
+        '''
+        Filters ids (sorted or not) down to the ones that still need doing
+        '''
+        ids = [int(idx) for idx in ids]
+        if not ids:
+            return []
+        finished = self.finished(min(ids), max(ids))
+        return [idx for idx in ids if idx not in finished]
+
+    def counts(self, lower=None, upper=None):
+        '''
+        Returns {status: number of ids}, optionally only between lower and
+        upper
+        '''
+        query = f'SELECT status, COUNT(*) FROM "{self.name}"'
+        args = ()
+        if lower is not None and upper is not None:
+            query += ' WHERE id BETWEEN ? AND ?'
+            args = (int(lower), int(upper))
+        with self.lock:
+            return dict(self.db.execute(query + ' GROUP BY status', args))
+
+    def failures(self):
+        '''
+        Returns {id: error} of the ids that are currently FAILED
+        '''
+        with self.lock:
+            return dict(self.db.execute(
+                f'SELECT id, error FROM "{self.name}" WHERE status = ?',
+                (FAILED,)))
+
+    def close(self):
+        with self.lock:
+            self._commit()
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def shard(lower, upper, k, n):
+    '''
+    Splits lower..upper (inclusive) into n contiguous ranges and returns
+    the bounds of the k-th one (0 based). Shards of one id range don't
+    overlap so each can run in its own process/machine
+    '''
+    if not 0 <= k < n:
+        raise ValueError(f'shard {k} is not in 0..{n - 1}')
+    size = upper - lower + 1
+    return (lower + size * k // n, lower + size * (k + 1) // n - 1)
+
+def parse_shard(value):
+    '''
+    argparse type for "k/n", e.g. --shard 2/8
+    '''
+    k, n = value.split('/')
+    return int(k), int(n)
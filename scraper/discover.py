@@ -0,0 +1,132 @@
+import os
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+class Density(NamedTuple):
+    '''
+    What the known ids say about how the id space is laid out
+
+        * stride  - distance between sample probes, small enough that every
+                    populated run gets at least a couple of samples
+        * hole    - biggest gap between ids that still counts as inside a run
+        * density - share of the ids inside runs that exist
+        * n_runs  - how many runs the known ids make up
+    '''
+    stride: int
+    hole: int
+    density: float
+    n_runs: int
+
+def known_ids(path_to_data='../data/known_ids/'):
+    '''
+    Returns the sorted unique ids of every csv in known_ids
+    '''
+    if not os.path.isdir(path_to_data):
+        return np.array([], dtype=np.int64)
+    ids = [pd.read_csv(os.path.join(path_to_data, filename))['ids']
+           for filename in sorted(os.listdir(path_to_data))
+           if filename.endswith('.csv')]
+    if not ids:
+        return np.array([], dtype=np.int64)
+    return np.unique(np.concatenate(ids)).astype(np.int64)
+
+def runs(ids, hole):
+    '''
+    Splits sorted ids into runs wherever two are more than `hole` apart.
+    Returns the arrays of the first and last id of each run
+    '''
+    breaks = np.flatnonzero(np.diff(ids) > hole)
+    return ids[np.r_[0, breaks + 1]], ids[np.r_[breaks, len(ids) - 1]]
+
+def learn(ids, max_stride=256, max_hole=64):
+    '''
+    Works out the Density from the known ids. The hole is 8 times the median
+    gap between neighbouring ids, the gaps between runs are way bigger than
+    that. The stride is half the 25th percentile run length. Too few ids to
+    learn from gives a cautious default
+    '''
+    if len(ids) < 2:
+        return Density(stride=16, hole=8, density=float('nan'), n_runs=0)
+    hole = int(min(max_hole, max(4, 8 * np.median(np.diff(ids)))))
+    firsts, lasts = runs(ids, hole)
+    lengths = lasts - firsts + 1
+    stride = int(min(max_stride, max(1, np.percentile(lengths, 25) // 2)))
+    return Density(stride, hole, float(len(ids) / lengths.sum()),
+                   len(lengths))
+
+def discover(prober, lower, upper, density, known=()):
+    '''
+    Finds the ids between lower and upper (inclusive) without asking about
+    every one of them. prober is an index_scraper.Prober.
+
+    1. Sample every density.stride-th id. Known ids count as free samples
+    2. Between two neighbouring samples that both exist everything gets
+       scanned. Between one that exists and one that doesn't, the end of the
+       run is binary searched (all the searches step together so each round
+       is one concurrent batch). A miss only counts if a spread of the next
+       hole - 1 ids are missing too, so a hole inside a run doesn't cut it
+       short
+    3. Densely scan the populated ranges that came out of 1 and 2
+
+    Two missing samples in a row are taken as a gap and skipped, a run
+    shorter than the stride can fall between them. Failed requests count as
+    existing so their surroundings get scanned.
+
+    Returns the number of ids the dense scans asked about
+    '''
+    prober.load(lower, upper)
+    known = [int(idx) for idx in known if lower <= idx <= upper]
+    for idx in known:
+        prober.known[idx] = True
+
+    samples = sorted(set(range(lower, upper + 1, density.stride)) |
+                     set(known) | {upper})
+    answers = prober.found(samples)
+    exists = {idx: answer is not False for idx, answer in answers.items()}
+
+    # Ids after a miss that have to be missing too, spread out (0, 1, 2, 4,
+    # ... hole - 1) so a hole is caught without asking about all of it
+    confirm = sorted({0, density.hole - 1} |
+                     {2 ** k for k in range(density.hole.bit_length())
+                      if 2 ** k < density.hole})
+    ranges = []
+    searches = []
+    for a, b in zip(samples, samples[1:]):
+        if exists[a] and exists[b]:
+            ranges.append((a + 1, b - 1))
+        elif exists[a]:
+            # [sample, last id found, first id missing, direction]
+            searches.append([a, a, b, 1])
+        elif exists[b]:
+            searches.append([b, b, a, -1])
+
+    while searches:
+        blocks = []
+        for _, hit, miss, step in searches:
+            mid = hit + step * (abs(miss - hit) // 2)
+            block = [mid + step * j for j in confirm]
+            blocks.append([idx for idx in block
+                           if step * (miss - idx) > 0])
+        answers = prober.found([idx for block in blocks for idx in block])
+        active = []
+        for search, block in zip(searches, blocks):
+            sample, hit, miss, step = search
+            hits = [idx for idx in block if answers[idx] is not False]
+            if hits:
+                search[1] = hits[-1]
+            else:
+                search[2] = block[0]
+            if abs(search[2] - search[1]) > 1:
+                active.append(search)
+            elif step > 0:
+                ranges.append((sample + 1, search[1]))
+            else:
+                ranges.append((search[1], sample - 1))
+        searches = active
+
+    dense = sorted({idx for first, last in ranges
+                    for idx in range(first, last + 1)})
+    prober.found(dense)
+    return len(dense)
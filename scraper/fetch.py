@@ -0,0 +1,228 @@
+import time
+import random
+import threading
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BASE_URL = 'https://www.gunviolencearchive.org/incident/'
+
+class RateLimiter:
+    '''
+    Token bucket. Lets through `rate` requests a second on average with
+    bursts of up to `burst`, callers block in wait until it's their turn
+    '''
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst,
+                                  self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                sleep = (1 - self.tokens) / self.rate
+            time.sleep(sleep)
+
+class RetryPolicy:
+    '''
+    Decides whether and how long to wait before trying a request again.
+
+    * Only connection errors/timeouts, 429s and 5xxs are retried, anything
+      else (200, 403, 404...) is the final answer
+    * At most `attempts` tries per url, waits grow exponentially from `base`
+      seconds up to `cap` with full jitter so threads don't retry in lockstep
+    * A Retry-After header on a 429/503 is honoured (still capped)
+    * The retry budget caps retries at `minimum` plus `ratio` of the
+      requests made so far. When upstream is having a bad time we give up
+      on urls instead of piling retries onto it
+    '''
+    def __init__(self, attempts=5, base=0.5, cap=30, ratio=0.2, minimum=20):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.ratio = ratio
+        self.minimum = minimum
+        self.n_requests = 0
+        self.n_retries = 0
+        self.lock = threading.Lock()
+
+    def retryable(self, status_code):
+        return status_code is None or status_code == 429 or \
+            status_code >= 500
+
+    def spend(self):
+        '''
+        Takes one retry out of the budget, False if it's used up
+        '''
+        with self.lock:
+            if self.n_retries >= self.minimum + self.ratio * self.n_requests:
+                return False
+            self.n_retries += 1
+            return True
+
+    def count_request(self):
+        with self.lock:
+            self.n_requests += 1
+
+    def delay(self, attempt, retry_after=None):
+        '''
+        Returns how many seconds to sleep before retry number `attempt`
+        '''
+        if retry_after is not None:
+            seconds = parse_retry_after(retry_after)
+            if seconds is not None:
+                return min(seconds, self.cap)
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+def parse_retry_after(value):
+    '''
+    Returns the seconds a Retry-After header asks for, it can either be a
+    number of seconds or an http date. None if it's neither
+    '''
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class FetchEngine:
+    '''
+    Fetches pages on a pool of threads. Each thread keeps its own
+    requests.Session so connections are kept alive and reused, and every
+    host gets its own RateLimiter (rate=None means no limit).
+
+    Retries follow the RetryPolicy. Urls that still failed in the end are
+    kept in self.failures ({url: last error}) for the failure report.
+    '''
+    def __init__(self, concurrency=16, rate=10, timeout=10, policy=None):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.policy = policy or RetryPolicy()
+        self.failures = {}
+        self.local = threading.local()
+        self.limiters = {}
+        self.lock = threading.Lock()
+        self.n_pages = 0
+        self.n_bytes = 0
+        self.seconds = 0
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.local.session = session
+        return self.local.session
+
+    def limiter(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.limiters:
+                self.limiters[host] = RateLimiter(self.rate)
+            return self.limiters[host]
+
+    def fetch(self, url, method='GET'):
+        '''
+        Returns (status code, page text) of one url. Status is None if the
+        last attempt errored out before getting a response
+        '''
+        self.policy.count_request()
+        attempt = 0
+        while True:
+            if self.rate:
+                self.limiter(url).wait()
+            retry_after = None
+            try:
+                page = self.session().request(method, url,
+                                              timeout=self.timeout)
+                status_code, text = page.status_code, page.text
+                error = f'HTTP {status_code}'
+                retry_after = page.headers.get('Retry-After')
+            except requests.exceptions.RequestException as e:
+                status_code, text, error = None, None, type(e).__name__
+
+            if not self.policy.retryable(status_code):
+                break
+            attempt += 1
+            if attempt >= self.policy.attempts:
+                self.failures[url] = error
+                break
+            if not self.policy.spend():
+                self.failures[url] = error + ' (retry budget spent)'
+                break
+            time.sleep(self.policy.delay(attempt, retry_after))
+
+        with self.lock:
+            self.n_pages += 1
+            self.n_bytes += len(text or '')
+        return status_code, text
+
+    def fetch_all(self, urls, method='GET'):
+        '''
+        Generator of (url, status code, page text) in the order they finish.
+        Only about 2 * concurrency requests are queued at any time, so the
+        pages stream out while later urls are still being fetched
+        '''
+        start = time.time()
+        urls = iter(urls)
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            pending = {}
+            while True:
+                for url in urls:
+                    pending[pool.submit(self.fetch, url, method)] = url
+                    if len(pending) >= 2 * self.concurrency:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    status_code, text = future.result()
+                    yield url, status_code, text
+                self.seconds = time.time() - start
+        self.seconds = time.time() - start
+
+    def report(self):
+        '''
+        Returns a one line summary of the run so far
+        '''
+        pages_per_sec = self.n_pages / self.seconds if self.seconds else 0
+        return (f'{self.n_pages} pages, {self.n_bytes / 1e6:.1f} MB in '
+                f'{self.seconds:.1f}s ({pages_per_sec:.1f} pages/sec), '
+                f'{self.policy.n_retries} retries, '
+                f'{len(self.failures)} failed')
+
+    def failure_report(self):
+        '''
+        Returns the failed urls grouped by their last error, one line each
+        '''
+        counts = Counter(self.failures.values())
+        return '\n'.join(f'{n:>6}  {error}'
+                         for error, n in counts.most_common())
+
+    def write_failures(self, path):
+        '''
+        Writes the failed urls and their last error to a csv
+        '''
+        with open(path, 'w') as f:
+            f.write('url,error\n')
+            for url, error in sorted(self.failures.items()):
+                f.write(f'{url},{error}\n')
@@ -1,97 +1,114 @@
 import os
-import csv
-import time
-import requests
+import argparse
 from bs4 import BeautifulSoup
 import pandas as pd
 
-def main_controller(lower, upper):
-    '''
-    Controls the script. First it will fetch the indices between the specified bounds - inclusively. Then for each index gets it page returns its soup (soup_opener), retrieves the data available from the soup (soup_eater), and writes that string to a csv (soup_pooper)
-    '''
-    ids = pd.read_csv('../data/assembled_ids.csv')['ids']
-
-    ids = ids[ids >= lower]
-    ids = ids[ids <= upper]
+from fetch import FetchEngine, BASE_URL
+from records import COLUMNS, Location, Participant, Gun, Incident
+import writer
+import checkpoint
 
-    for id in ids:
-        print(id)
-        row = str(id) + ','
-        url = f'https://www.gunviolencearchive.org/incident/{id}'
-        soup = soup_opener(url)
-        row += soup_eater(soup)
-        # print(row)
-        soup_pooper(row)
-
-def soup_opener(url):
-    '''
-    Rescursive controller for opening the soup. A lot of the time the first scrape doesn't work so it needs to be done until it is!
+# lxml builds soups faster, html.parser is the fallback when it's missing
+try:
+    import lxml
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
 
-    Returns soup
+def main_controller(lower=None, upper=None, base_url=BASE_URL, concurrency=16,
+                    rate=10, shard=None, out=None,
+                    checkpoint_path='../data/checkpoints.db'):
     '''
-    idx = int(url.split('/')[-1])
-    soup, status_code = opener(url)
-    if status_code == 200:
-        return soup
-    else:
-        return soup_opener(url)
+    Controls the script. First it will fetch the indices between the specified bounds - inclusively, all of them when there are no bounds. With shard=(k, n) only the k-th of n slices of that range is scraped, so n of these can run side by side, each writing its own csv.
 
-def opener(url):
+    Ids the checkpoint (checkpoint.py) already has as done or missing are skipped, so a run that got interrupted carries on where it stopped. The pages are fetched concurrently by a FetchEngine and as each one comes back its data is retrieved from the soup (soup_eater), and that Incident is queued up for the csv writer (a BatchWriter on ../data/id_data.csv). Ids are only checkpointed as done once their row is on disk
     '''
-    Returns the soup and status code from the url
-    '''
-    idx = int(url.split('/')[-1])
-    try:
-        page = requests.get(url, timeout=10)
-        return BeautifulSoup(page.text, 'html.parser'), page.status_code
-    except requests.exceptions.SSLError:
-        now = round(time.time() - start)
-        print(f'SSLError on {idx}, trying again......', now)
-        return opener(url)
-    except requests.exceptions.ChunkedEncodingError:
-        now = round(time.time() - start)
-        print(f'ChunkedEncodingError on {idx}, trying again...', now)
-        return opener(url)
-    except requests.exceptions.ConnectionError:
-        now = round(time.time() - start)
-        print(f'Oops! Lost Connection on {idx}, trying again...', now)
-        return opener(url)
-    except requests.exceptions.ReadTimeout:
-        return opener(url)
-
-def soup_eater(soup):
-    '''
-    Main parser of the soup. Checks to see what is in the soup (gun types, notes, etc...) and tasks helper functions with extracting the data. All the helper functions this calls start with "scrape"
-    '''
-    # This div has all the data in it
-    main_divs = soup.find('div', {'id': 'block-system-main'}).select('div')
-    # Headers to check what's in page
-    h2s = [h2.text for h2 in soup.find_all('h2')]
+    ids = pd.read_csv('../data/assembled_ids.csv')['ids']
 
-    data = scrape_header(soup)
-    data += scrape_location(main_divs)
-    if 'Guns Involved' in h2s:
-        data += scrape_guns(main_divs)
-    else:
-        data += ',,'
-    if 'Incident Characteristics' in h2s:
-        data += scrape_characteristics(main_divs)
-    else:
-        data += ','
-    if 'Notes' in h2s:
-        data += scrape_notes(main_divs)
-    else:
-        data += ','
-    if 'Participants' in h2s:
-        data += scrape_participants(main_divs)
-    else:
-        data += ',,,,,,,,'
-    if 'Sources' in h2s:
-        data += scrape_sources(main_divs)
-    else:
-        data += ','
+    lower = int(ids.min() if lower is None else lower)
+    upper = int(ids.max() if upper is None else upper)
+    if shard is not None:
+        lower, upper = checkpoint.shard(lower, upper, *shard)
+    if out is None:
+        out = '../data/id_data.csv' if shard is None else \
+            '../data/id_data.shard{}of{}.csv'.format(*shard)
+    ids = ids[ids >= lower]
+    ids = ids[ids <= upper]
 
-    return data
+    progress = checkpoint.Checkpoint(checkpoint_path, 'incidents')
+    # Rows that made it to the csv count as done even if the checkpoint
+    # didn't get committed before a crash
+    if os.path.isfile(out):
+        writer.repair(out)
+        saved = pd.read_csv(out, usecols=['incident_id'])['incident_id']
+        progress.mark_many(saved[saved.between(lower, upper)],
+                           checkpoint.DONE)
+    todo = progress.pending(ids)
+    print(f'{len(ids) - len(todo)} of {len(ids)} ids between {lower} and '
+          f'{upper} already done, {len(todo)} to go')
+
+    def written(rows):
+        progress.mark_many((row[0] for row in rows), checkpoint.DONE)
+
+    engine = FetchEngine(concurrency=concurrency, rate=rate)
+    urls = [base_url + str(id) for id in todo]
+    with writer.BatchWriter(out, COLUMNS, on_batch=written) as csv_writer:
+        for url, status_code, html in engine.fetch_all(urls):
+            id = int(url.split('/')[-1])
+            if status_code == 404:
+                progress.mark(id, checkpoint.MISSING)
+                continue
+            if status_code != 200:
+                print(f'Got {status_code} on {id}, skipping')
+                progress.mark(id, checkpoint.FAILED,
+                              engine.failures.get(url, f'HTTP {status_code}'))
+                continue
+            print(id)
+            soup = BeautifulSoup(html, PARSER)
+            incident = soup_eater(soup, id)
+            csv_writer.write(incident.fields())
+    print(engine.report())
+    print(progress.counts(lower, upper))
+    progress.close()
+    if engine.failures:
+        print(engine.failure_report())
+        engine.write_failures('../data/failed_incidents.csv')
+
+def soup_eater(soup, incident_id):
+    '''
+    Main parser of the soup. Splits the page into its sections (split_sections), checks which ones are there (gun types, notes, etc...) and hands each helper function only its own section to extract the data from. All the helper functions this calls start with "scrape"
+
+    Returns an Incident record
+    '''
+    sections = split_sections(soup)
+    parsers = {
+        'Guns Involved': ('guns', scrape_guns),
+        'Incident Characteristics': ('characteristics', scrape_characteristics),
+        'Notes': ('notes', scrape_notes),
+        'Participants': ('participants', scrape_participants),
+        'Sources': ('sources', scrape_sources),
+    }
+    data = {field: parser(sections[title])
+            for title, (field, parser) in parsers.items() if title in sections}
+
+    return Incident(
+        incident_id=incident_id,
+        date=scrape_header(soup),
+        location=scrape_location(sections['Location']),
+        **data
+    )
+
+def split_sections(soup):
+    '''
+    Walks the div with all the data in it once and returns a dict of
+    {h2 title: the div under that h2}. A section is the closest div around
+    its h2
+    '''
+    main = soup.find('div', {'id': 'block-system-main'})
+    sections = {}
+    for h2 in main.find_all('h2'):
+        sections[h2.text] = h2.find_parent('div')
+    return sections
 
 def scrape_header(soup):
     '''
@@ -100,10 +117,9 @@ def scrape_header(soup):
     The only data point retrieved is the date
     '''
     tag = soup.find_all('h1')[-1].text
-    date = tag.split()[0]
-    return date + ','
+    return tag.split()[0]
 
-def scrape_location(main_divs):
+def scrape_location(section):
     '''
     soup_eater calls this to scrape the location data
 
@@ -113,98 +129,59 @@ def scrape_location(main_divs):
         * City & State
         * Lat/Lon
     '''
-    for div in main_divs:
-        div_h2s = [h2.text for h2 in div.find_all('h2')]
-        if 'Location' in div_h2s:
-            spans = [span.text for span in div.find_all('span')]
+    spans = [span.text for span in section.find_all('span')]
 
-    # Loc. Description
-    if len(spans) == 4:
-        data = spans[0] + ','
-    else:
-        data = ','
-    # Address
-    data += spans[-3] + ','
-    # City/State
-    city = spans[-2].split(', ')[0]
-    state = spans[-2].split(', ')[1]
-    data += city + ',' + state  + ','
-    # Lat/Lon
-    lat = spans[-1].split()[1].strip(',')
-    lon = spans[-1].split()[2]
-    data += lat + ',' + lon + ','
+    city, state = spans[-2].split(', ')[:2]
+    return Location(
+        # Loc. Description
+        description=spans[0] if len(spans) == 4 else '',
+        address=spans[-3],
+        city=city,
+        state=state,
+        lat=spans[-1].split()[1].strip(','),
+        lon=spans[-1].split()[2],
+    )
 
-    return data
+def list_traits(ul):
+    '''
+    Returns {trait: value} from a list of "Trait Name: value" items, the
+    trait names are snake cased
+    '''
+    traits = {}
+    for li in ul.find_all('li'):
+        trait, _, value = li.text.partition(': ')
+        traits[trait.lower().replace(' ', '_')] = value
+    return traits
 
-def scrape_participants(main_divs):
+def scrape_participants(section):
     '''
     parser calls this to scrape information about the participant(s)
 
-    For each participant, the scraper will gather type and status and look for
+    For each participant (one list each), the scraper will gather type and status and look for
     additional data points like name, age, age group, and gender
     '''
-    # Get the list items with the data
-    for div in main_divs:
-        div_h2s = [h2.text for h2 in div.find_all('h2')]
-        if 'Participants' in div_h2s:
-            list_items = [li.text for li in div.find_all('li')]
-
-    # Pull data out of list_items
-    cols = ['type', 'status', 'name', 'age', 'age_group', 'gender']
-    data = [['' for col in cols]]
-    part_df = pd.DataFrame(data=data, columns=cols)
-    for item in list_items:
-        trait = item.split(': ')[0].lower().replace(' ', '_')
-        if trait == 'relationship': # opting not to scrape this data, too sparse
-            continue
-        value = item.split(': ')[1]
-        value = value.replace(',', ';')
-        if part_df[trait][0] != '':
-            value = '||' + value
-        part_df[trait] += value
-
-    # Count number of injured and killed
-    statuses = part_df['status'].iloc[0].split('||')
-    statuses = [status.lower() for status in statuses]
-    n_killed = str(statuses.count('killed'))
-    n_injured = str(statuses.count('injured'))
+    participants = []
+    for ul in section.find_all('ul'):
+        traits = list_traits(ul)
+        # opting not to scrape relationship, too sparse
+        participants.append(Participant(**{
+            field: traits.get(field, '') for field in Participant._fields
+        }))
+    return participants
 
-    # Assemble row
-    data = part_df.values.astype(str)[0]
-    data = ','.join(data) + ','
-    data = n_killed + ',' + n_injured + ',' + data
-
-    return data
-
-def scrape_guns(main_divs):
+def scrape_guns(section):
     '''
     parser calls this to scrape the type and stolen status of each gun
-    recorded
+    recorded (one list each)
     '''
-    # Get the list items with the data
-    for div in main_divs:
-        div_h2s = [h2.text for h2 in div.find_all('h2')]
-        if 'Guns Involved' in div_h2s:
-            list_items = [li.text for li in div.find_all('li')]
-
-    # Pull data out of list_items
-    cols = ['type', 'stolen']
-    data = [['' for col in cols]]
-    gun_df = pd.DataFrame(data=data, columns=cols)
-    for item in list_items:
-        trait = item.split(': ')[0].lower().replace(' ', '_')
-        value = item.split(': ')[1]
-        if trait:
-            '||' + value
-        gun_df[trait] += value
+    guns = []
+    for ul in section.find_all('ul'):
+        traits = list_traits(ul)
+        guns.append(Gun(type=traits.get('type', ''),
+                        stolen=traits.get('stolen', '')))
+    return guns
 
-    data = gun_df.values.astype(str)[0]
-    data = ','.join(data) + ','
-
-    return data
-
-
-def scrape_characteristics(main_divs):
+def scrape_characteristics(section):
     '''
     parser calls this to scrape all of the characteristics about the
     incident. Examples: "Shot - Wounded/Injured", "Assault weapon",
@@ -213,59 +190,32 @@ def scrape_characteristics(main_divs):
     I have noticed these characteristics are inconsistent at best so take them
     with a lot of salt.
     '''
-    for div in main_divs:
-        div_h2s = [h2.text for h2 in div.find_all('h2')]
-        if 'Incident Characteristics' in div_h2s:
-            list_items = [li.text for li in div.find_all('li')]
-    list_items = '||'.join(list_items)
-    list_items = list_items.replace(',', ';')
-    return list_items + ','
+    return [li.text for li in section.find_all('li')]
 
-def scrape_notes(main_divs):
+def scrape_notes(section):
     '''
     parser calls this to scrape the hand written notes of the incident
     '''
-    for div in main_divs:
-        if 'Notes' in [h2.text for h2 in div.find_all('h2')]:
-            note_text = div.find('p').text
-            note_text = note_text.replace(',', ';')
-            note_text = note_text.replace('\n', '')
-    return note_text + ','
+    return section.find('p').text
 
-def scrape_sources(main_divs):
+def scrape_sources(section):
     '''
     parser calls this to scrape the urls of the news links
     '''
-    for div in main_divs:
-        if 'Sources' in [h2.text for h2 in div.find_all('h2')]:
-            sources = []
-            for link in div.find_all('a'):
-                sources.append(link.get('href'))
-    # Wrap it in quotes, otherwise the commas will cause problems
-    sources = ['"' + source + '"' for source in sources]
-    return '||'.join(sources)
-
-def soup_pooper(row):
-    '''
-    Takes in the entire line as a string and writes it to the filename
-
-    Also checks if the csv file exists, if not, it makes it with the right
-    column names
-    '''
-    pathname = '../data/'
-    filename = 'id_data.csv'
-    # checks if the csv exists
-    col_names = ['incident_id', 'date', 'location_description', 'address', 'city', 'state', 'lat', 'lon', 'gun_types', 'gun_stolen', 'incident_characteristics',  'notes', 'n_killed', 'n_injured', 'participant_type', 'participant_status', 'participant_name', 'participant_age', 'participant_age_group', 'participant_gender', 'sources']
-    if filename not in os.listdir(pathname):
-        with open(pathname+filename, 'w') as f:
-            f.write(','.join(col_names))
-            f.write('\n')
-    # this is the save
-    with open(pathname+filename, 'a') as f:
-        f.write(row)
-        f.write('\n')
+    return [link.get('href') for link in section.find_all('a')]
 
 if __name__ == '__main__':
-    lower =200000
-    upper =200500
-    main_controller(lower, upper)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('lower', type=int, nargs='?')
+    parser.add_argument('upper', type=int, nargs='?')
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=10,
+                        help='max requests per second per host')
+    parser.add_argument('--shard', type=checkpoint.parse_shard,
+                        help='k/n, scrape the k-th (0 based) of n slices')
+    parser.add_argument('--out', help='csv to append the incidents to')
+    parser.add_argument('--checkpoint', default='../data/checkpoints.db')
+    args = parser.parse_args()
+    main_controller(args.lower, args.upper, args.base_url, args.concurrency,
+                    args.rate, args.shard, args.out, args.checkpoint)
@@ -1,13 +1,100 @@
 import os
+import argparse
+import numpy as np
 import pandas as pd
 
+class IdSet:
+    '''
+    Set of non negative integer ids kept as one byte per possible id, so
+    memory depends on the biggest id and not on how many shards or
+    duplicates went in. Grows by doubling when a bigger id shows up
+    '''
+    def __init__(self, size=1 << 20):
+        self.flags = np.zeros(size, dtype=bool)
+
+    def add(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = ids[ids >= 0]
+        if not len(ids):
+            return
+        top = int(ids.max())
+        if top >= len(self.flags):
+            size = len(self.flags)
+            while size <= top:
+                size *= 2
+            flags = np.zeros(size, dtype=bool)
+            flags[:len(self.flags)] = self.flags
+            self.flags = flags
+        self.flags[ids] = True
+
+    def __len__(self):
+        return int(np.count_nonzero(self.flags))
+
+    def blocks(self, block=1 << 16):
+        '''
+        Yields the ids in order, as arrays of the ids in each block of
+        `block` possible ids
+        '''
+        for start in range(0, len(self.flags), block):
+            ids = np.flatnonzero(self.flags[start:start + block])
+            if len(ids):
+                yield ids + start
+
+def shards(path_to_data):
+    '''
+    The csv files in path_to_data
+    '''
+    return [os.path.join(path_to_data, filename)
+            for filename in sorted(os.listdir(path_to_data))
+            if filename.endswith('.csv')]
+
+def read_ids(paths, chunksize=100000):
+    '''
+    Yields the ids of each shard a chunk at a time, only one chunk is ever
+    in memory
+    '''
+    for path in paths:
+        for chunk in pd.read_csv(path, usecols=['ids'], chunksize=chunksize):
+            yield pd.to_numeric(chunk['ids'], errors='coerce').dropna()
+
+def assemble(paths, out, chunksize=100000):
+    '''
+    Merges the ids of every shard in paths into out (one sorted, duplicate
+    free 'ids' column). Each shard is streamed in chunks into an IdSet and
+    the result is written a block at a time, so it's one pass over the
+    shards and memory stays the size of the IdSet however many shards there
+    are.
+
+    Returns the number of ids written
+    '''
+    id_set = IdSet()
+    for ids in read_ids(paths, chunksize):
+        id_set.add(ids)
+    n_ids = 0
+    with open(out, 'w') as f:
+        f.write('ids\n')
+        for ids in id_set.blocks():
+            f.write('\n'.join(map(str, ids.tolist())))
+            f.write('\n')
+            n_ids += len(ids)
+    return n_ids
+
 def assembler(path_to_data):
-    filenames = [e for e in os.listdir(path_to_data) if e[-3:] == 'csv']
-    df = pd.read_csv(path_to_data + filenames.pop())
-    for filename in filenames:
-        df = pd.concat([df, pd.read_csv(path_to_data + filename)])
-    return df
+    '''
+    Returns a DataFrame of the sorted, duplicate free ids of every csv in
+    path_to_data
+    '''
+    id_set = IdSet()
+    for ids in read_ids(shards(path_to_data)):
+        id_set.add(ids)
+    return pd.DataFrame({'ids': np.concatenate(
+        list(id_set.blocks()) or [np.array([], dtype=np.int64)])})
 
 if __name__ == '__main__':
-    path_to_data = '../data/known_ids/'
-    df = assembler(path_to_data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path_to_data', nargs='?', default='../data/known_ids/')
+    parser.add_argument('--out', default='../data/assembled_ids.csv')
+    parser.add_argument('--chunksize', type=int, default=100000)
+    args = parser.parse_args()
+    n_ids = assemble(shards(args.path_to_data), args.out, args.chunksize)
+    print(f'{n_ids} ids written to {args.out}')
@@ -1,34 +1,14 @@
 import os
-import csv
 import sys
 import time
-import requests
-from bs4 import BeautifulSoup
-from multiprocessing import Pool, cpu_count
+import argparse
 
-def open_soup(url):
-    '''
-    using the url requests the page and returns the soup and the status code
-    '''
-    idx = int(url.split('/')[-1])
-    try:
-        printout(f'Trying a request on {idx}')
-        page = requests.get(url, timeout=10)
-        return BeautifulSoup(page.text, 'html.parser'), page.status_code
-    except requests.exceptions.SSLError:
-        now = round(time.time() - start)
-        print(f'SSLError on {idx}, trying again......', now)
-        return open_soup(url)
-    except requests.exceptions.ChunkedEncodingError:
-        now = round(time.time() - start)
-        print(f'ChunkedEncodingError on {idx}, trying again...', now)
-        return open_soup(url)
-    except requests.exceptions.ConnectionError:
-        now = round(time.time() - start)
-        print(f'Oops! Lost Connection on {idx}, trying again...', now)
-        return open_soup(url)
-    except requests.exceptions.ReadTimeout:
-        return open_soup(url)
+from fetch import FetchEngine, BASE_URL
+from writer import BatchWriter, repair
+import checkpoint
+import discover
+
+start = time.time()
 
 def printout(message):
     '''
@@ -43,42 +23,148 @@ def printout(message):
     sys.stdout.write('\r')
     sys.stdout.flush()
 
-def save(idx):
+def saved_ids(path):
     '''
-    simple save
+    The ids already in scraped_ids.csv
     '''
-    pathname = '../data/known_ids/'
-    filename = 'scraped_ids.csv'
-    # checks if the csv exists
-    if filename not in os.listdir(pathname):
-        with open(pathname+filename, 'w') as f:
-            f.write('ids')
-            f.write('\n')
-    # this is the save
-    with open(pathname+filename, 'a') as f:
-        f.write(str(idx))
-        f.write('\n')
+    if not os.path.isfile(path):
+        return []
+    repair(path)
+    with open(path) as f:
+        return [int(line) for line in f if line.strip().isdigit()]
 
-def check_idx(url):
+class Prober:
     '''
-    main function, saves the index if it finds a page
+    Asks the site whether batches of indices have a page.
+
+    The asking is all waiting on the network, so it's done by a FetchEngine
+    with `concurrency` requests in flight and HEAD requests by default, the
+    status code is all we need. Answers come back to the calling thread,
+    which checkpoints the 404s and queues found ids on the BatchWriter for
+    `out`. Found ids are checkpointed by written once they're on disk, and
+    that runs on the writer's thread, so the checkpoint gets used from two
+    threads (it locks around its connection). Anything the checkpoint or
+    `out` already knows isn't asked again.
+
+    Only one Prober may write to an `out` at a time, shards running side by
+    side each need their own (see __main__). The checkpoint database can be
+    shared, sqlite handles the other processes.
     '''
-    idx = int(url.split('/')[-1])
-    soup, status_code = open_soup(url)
-    if status_code == 200:
-        save(idx)
-    elif status_code == 404:
-        pass
-    elif status_code == 403:
-        pass
-    else:
-        check_idx(url)
+    def __init__(self, base_url=BASE_URL, concurrency=200, rate=None,
+                 method='HEAD', checkpoint_path='../data/checkpoints.db',
+                 out='../data/known_ids/scraped_ids.csv'):
+        self.base_url = base_url
+        self.method = method
+        self.engine = FetchEngine(concurrency=concurrency, rate=rate)
+        self.progress = checkpoint.Checkpoint(checkpoint_path, 'index')
+        # Anything in scraped_ids.csv is done even if the checkpoint didn't
+        # get committed
+        self.progress.mark_many(saved_ids(out), checkpoint.DONE)
+        self.writer = BatchWriter(out, ['ids'], on_batch=self.written)
+        self.known = {}
+        self.n_found = 0
+
+    def written(self, rows):
+        self.progress.mark_many((row[0] for row in rows), checkpoint.DONE)
+
+    def load(self, lower, upper):
+        '''
+        Reads what the checkpoint has between lower and upper, call this
+        before asking about a range
+        '''
+        for idx, status in self.progress.statuses(lower, upper).items():
+            if status != checkpoint.FAILED:
+                self.known[idx] = status == checkpoint.DONE
+
+    def found(self, ids):
+        '''
+        Returns {index: True if it has a page, False if it's a 404, None if
+        it failed} for every one of ids. Only the ones we don't know yet
+        are requested
+        '''
+        answers = {idx: self.known[idx] for idx in ids if idx in self.known}
+        todo = [idx for idx in ids if idx not in answers]
+        urls = (self.base_url + str(idx) for idx in todo)
+        for i, (url, status_code, _) in enumerate(
+                self.engine.fetch_all(urls, self.method)):
+            idx = int(url.split('/')[-1])
+            if status_code == 200:
+                self.writer.write([idx])
+                self.n_found += 1
+                answers[idx] = self.known[idx] = True
+            elif status_code == 404:
+                self.progress.mark(idx, checkpoint.MISSING)
+                answers[idx] = self.known[idx] = False
+            else:
+                self.progress.mark(idx, checkpoint.FAILED,
+                                   self.engine.failures.get(
+                                       url, f'HTTP {status_code}'))
+                answers[idx] = None
+            if i % 100 == 0:
+                printout(f'{i} of {len(todo)} probed, {self.n_found} found')
+        return answers
+
+    def n_requests(self):
+        return self.engine.policy.n_requests + self.engine.policy.n_retries
+
+    def close(self):
+        self.writer.close()
+        self.progress.close()
+
+def probe(prober, lower, upper):
+    '''
+    Checks every index between lower and upper (inclusive)
+    '''
+    prober.load(lower, upper)
+    ids = range(lower, upper + 1)
+    n_known = sum(idx in prober.known for idx in ids)
+    print(f'{n_known} indices between {lower} and {upper} already done, '
+          f'{len(ids) - n_known} to go')
+    prober.found(ids)
 
 if __name__ == '__main__':
-    start = time.time()
-    urls = []
-    for idx in range(1, 25000):
-        urls.append(f'https://www.gunviolencearchive.org/incident/{idx}')
-    with Pool(cpu_count()) as p:
-        p.map(check_idx, urls)
-    print('Done!', round(time.time() - start))
+    parser = argparse.ArgumentParser()
+    parser.add_argument('lower', type=int, nargs='?', default=1)
+    parser.add_argument('upper', type=int, nargs='?', default=24999)
+    parser.add_argument('--shard', type=checkpoint.parse_shard,
+                        help='k/n, probe the k-th (0 based) of n slices')
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--rate', type=float,
+                        help='max requests per second per host')
+    parser.add_argument('--method', default='HEAD',
+                        help='GET for servers that won\'t answer HEAD')
+    parser.add_argument('--out',
+                        help='csv to append found ids to, one per shard by '
+                             'default')
+    parser.add_argument('--checkpoint', default='../data/checkpoints.db')
+    parser.add_argument('--discover', action='store_true',
+                        help='learn where ids are from known_ids and only '
+                             'scan the populated ranges (discover.py)')
+    args = parser.parse_args()
+    lower, upper = args.lower, args.upper
+    if args.shard is not None:
+        lower, upper = checkpoint.shard(lower, upper, *args.shard)
+    out = args.out
+    if out is None:
+        # index_assemble picks up every csv in known_ids
+        out = '../data/known_ids/scraped_ids.csv' if args.shard is None else \
+            '../data/known_ids/scraped_ids.shard{}of{}.csv'.format(*args.shard)
+    prober = Prober(args.base_url, args.concurrency, args.rate, args.method,
+                    args.checkpoint, out)
+    if args.discover:
+        known = discover.known_ids()
+        density = discover.learn(known)
+        print(density)
+        discover.discover(prober, lower, upper, density, known)
+    else:
+        probe(prober, lower, upper)
+    prober.close()
+    print(prober.engine.report())
+    requests = prober.n_requests()
+    print(f'{requests} requests for {prober.n_found} new ids '
+          f'({requests / max(1, prober.n_found):.2f} requests per id)')
+    with checkpoint.Checkpoint(args.checkpoint, 'index') as progress:
+        print(progress.counts(lower, upper))
+    if prober.engine.failures:
+        print(prober.engine.failure_report())
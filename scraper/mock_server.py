@@ -0,0 +1,146 @@
+import sys
+import time
+import random
+import threading
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+PAGE = '''<html><body>
+<h1>Gun Violence Archive</h1>
+<h1>{date} Incident {idx}</h1>
+<div id="block-system-main">
+<div><h2>Location</h2>
+<span>{place}</span>
+<span>{idx} Main St</span>
+<span>Springfield, Illinois</span>
+<span>Geolocation: {lat}, {lon}</span>
+</div>
+<div><h2>Participants</h2>
+<ul>
+<li>Type: Victim</li>
+<li>Name: Jane Doe</li>
+<li>Age: {age}</li>
+<li>Age Group: Adult 18+</li>
+<li>Gender: Female</li>
+<li>Status: Injured</li>
+</ul>
+<ul>
+<li>Type: Subject-Suspect</li>
+<li>Age Group: Adult 18+</li>
+<li>Gender: Male</li>
+<li>Relationship: Stranger</li>
+<li>Status: Unharmed, Arrested</li>
+</ul>
+</div>
+<div><h2>Incident Characteristics</h2>
+<ul><li>Shot - Wounded/Injured</li><li>Drive-by (car to street, car to car)</li></ul>
+</div>
+<div><h2>Notes</h2>
+<p>Victim shot in the leg, suspect fled, later arrested.</p>
+</div>
+<div><h2>Guns Involved</h2>
+<ul><li>Type: Handgun</li><li>Stolen: Unknown</li></ul>
+<ul><li>Type: 9mm</li><li>Stolen: Stolen</li></ul>
+</div>
+<div><h2>Sources</h2>
+<a href="http://example.com/news/{idx}">news</a>
+<a href="http://example.com/more-news/{idx}?a=1,2">more news</a>
+</div>
+</div>
+</body></html>'''
+
+def incident_page(idx):
+    '''
+    Returns a canned incident page laid out like the real ones, everything
+    the scraper parses is in it. Same idx, same page
+    '''
+    rng = random.Random(idx)
+    return PAGE.format(
+        idx=idx,
+        date='2018-0{}-1{}'.format(rng.randint(1, 9), rng.randint(0, 9)),
+        place=rng.choice(['Walmart', 'Oak Park', 'Gas station']),
+        lat=round(rng.uniform(37, 42), 4),
+        lon=round(rng.uniform(-91, -87), 4),
+        age=rng.randint(15, 70),
+    )
+
+def exists(idx):
+    '''
+    Which ids the mock "has". Ids come in runs so the id space is sparse and
+    clumpy like the real one
+    '''
+    return (idx // 50) % 3 != 0
+
+class MockHandler(BaseHTTPRequestHandler):
+    '''
+    Serves /incident/<id>. Settings live on the server so a test can change
+    them while it's running:
+        * latency   - seconds to sleep before answering
+        * fail_rate - share of requests answered with a 503
+        * exists    - function of the id, whether it has a page
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def respond(self, send_body):
+        server = self.server
+        with server.lock:
+            server.n_requests += 1
+        time.sleep(server.latency)
+
+        try:
+            idx = int(self.path.rstrip('/').split('/')[-1])
+        except ValueError:
+            idx = -1
+
+        if random.random() < server.fail_rate:
+            status, body = 503, b'busy'
+        elif idx >= 0 and server.exists(idx):
+            status, body = 200, incident_page(idx).encode('utf-8')
+        else:
+            status, body = 404, b'not found'
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def serve(port=0, latency=0.0, fail_rate=0.0, exists=exists):
+    '''
+    Starts the mock in a background thread and returns the server, its
+    base url is server.base_url. Port 0 picks a free one, exists can swap in
+    a different id layout
+    '''
+    server = MockServer(('127.0.0.1', port), MockHandler)
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.exists = exists
+    server.n_requests = 0
+    server.lock = threading.Lock()
+    server.base_url = f'http://127.0.0.1:{server.server_address[1]}/incident/'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    server = serve(port, latency=0.05)
+    print(f'Serving canned incidents at {server.base_url}')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
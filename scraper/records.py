@@ -0,0 +1,84 @@
+from typing import NamedTuple, Sequence
+
+# Column order of id_data.csv, Incident.fields returns its values in this
+# order
+COLUMNS = ['incident_id', 'date', 'location_description', 'address', 'city',
+           'state', 'lat', 'lon', 'gun_types', 'gun_stolen',
+           'incident_characteristics', 'notes', 'n_killed', 'n_injured',
+           'participant_type', 'participant_status', 'participant_name',
+           'participant_age', 'participant_age_group', 'participant_gender',
+           'sources']
+
+class Location(NamedTuple):
+    description: str = ''
+    address: str = ''
+    city: str = ''
+    state: str = ''
+    lat: str = ''
+    lon: str = ''
+
+class Participant(NamedTuple):
+    type: str = ''
+    status: str = ''
+    name: str = ''
+    age: str = ''
+    age_group: str = ''
+    gender: str = ''
+
+class Gun(NamedTuple):
+    type: str = ''
+    stolen: str = ''
+
+class Incident(NamedTuple):
+    '''
+    Everything scraped off one incident page. The list fields default to
+    empty tuples, a [] default would be one list shared by every Incident
+    '''
+    incident_id: int
+    date: str
+    location: Location
+    guns: Sequence[Gun] = ()
+    characteristics: Sequence[str] = ()
+    notes: str = ''
+    participants: Sequence[Participant] = ()
+    sources: Sequence[str] = ()
+
+    @property
+    def n_killed(self):
+        return sum(p.status.lower() == 'killed' for p in self.participants)
+
+    @property
+    def n_injured(self):
+        return sum(p.status.lower() == 'injured' for p in self.participants)
+
+    def fields(self):
+        '''
+        Returns the values of COLUMNS for this incident. Multiple guns,
+        participants, etc are joined with '||' like the Kaggle data
+        '''
+        loc = self.location
+        # No participants section means the counts are unknown, not zero
+        n_killed = str(self.n_killed) if self.participants else ''
+        n_injured = str(self.n_injured) if self.participants else ''
+        return [
+            str(self.incident_id), self.date, loc.description, loc.address,
+            loc.city, loc.state, loc.lat, loc.lon,
+            join(g.type for g in self.guns),
+            join(g.stolen for g in self.guns),
+            join(self.characteristics),
+            self.notes,
+            n_killed, n_injured,
+            join(p.type for p in self.participants),
+            join(p.status for p in self.participants),
+            join(p.name for p in self.participants),
+            join(p.age for p in self.participants),
+            join(p.age_group for p in self.participants),
+            join(p.gender for p in self.participants),
+            join(self.sources),
+        ]
+
+def join(values):
+    '''
+    '||' joins the non empty values
+    '''
+    return '||'.join(value for value in values if value)
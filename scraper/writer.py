@@ -0,0 +1,133 @@
+import os
+import csv
+import time
+import queue
+import threading
+
+class BatchWriter:
+    '''
+    Appends rows to a csv from a single background thread.
+
+    Any number of threads can call write, rows go through a queue to the
+    writer thread which buffers them and writes a batch once it has
+    batch_size rows or flush_every seconds have passed. Every batch is
+    flushed and fsynced, so after a crash the file holds everything up to
+    the last batch (plus maybe half a row, which gets cut off next time the
+    file is opened). Quoting is done by the csv module, the only change to
+    values is newlines becoming spaces so every row stays on one line.
+
+    on_batch, if given, gets called (on the writer thread) with the rows of
+    each batch once they are on disk, e.g. to checkpoint their ids.
+
+    Use it as a context manager so the last partial batch gets written.
+    '''
+    def __init__(self, path, columns, batch_size=200, flush_every=5.0,
+                 on_batch=None):
+        self.path = path
+        self.columns = columns
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+        self.on_batch = on_batch
+        self.n_rows = 0
+        self.queue = queue.Queue()
+        self.error = None
+
+        if os.path.isfile(path):
+            repair(path)
+        new = not os.path.isfile(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', newline='', encoding='utf-8')
+        self.csv = csv.writer(self.file, lineterminator='\n')
+        if new:
+            self.csv.writerow(columns)
+            self.sync()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, row):
+        '''
+        Queues one row (a list of values in column order)
+        '''
+        if self.error is not None:
+            raise self.error
+        self.queue.put([one_line(value) for value in row])
+
+    def run(self):
+        batch = []
+        last_flush = time.monotonic()
+        done = False
+        while not done:
+            timeout = max(0, self.flush_every - (time.monotonic() - last_flush))
+            try:
+                row = self.queue.get(timeout=timeout)
+                if row is None:
+                    done = True
+                else:
+                    batch.append(row)
+            except queue.Empty:
+                pass
+            if batch and (done or len(batch) >= self.batch_size or
+                          time.monotonic() - last_flush >= self.flush_every):
+                try:
+                    self.csv.writerows(batch)
+                    self.sync()
+                    if self.on_batch is not None:
+                        self.on_batch(batch)
+                except Exception as e:
+                    self.error = e
+                    return
+                self.n_rows += len(batch)
+                batch = []
+            if not batch:
+                last_flush = time.monotonic()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        '''
+        Writes whatever is still queued and closes the file
+        '''
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def one_line(value):
+    if isinstance(value, str):
+        return value.replace('\r\n', ' ').replace('\n', ' ').replace('\r', ' ')
+    return value
+
+def repair(path):
+    '''
+    Cuts off a half written last line, if a crash left one behind
+    '''
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        # Walk back to the last newline
+        block = 4096
+        end = size
+        while end > 0:
+            start = max(0, end - block)
+            f.seek(start)
+            chunk = f.read(end - start)
+            i = chunk.rfind(b'\n')
+            if i >= 0:
+                f.truncate(start + i + 1)
+                return
+            end = start
+        f.truncate(0)
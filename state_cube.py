@@ -0,0 +1,71 @@
+import numpy as np
+
+# The last axis of the cube, and the state_clean.csv columns they come from
+MEASURES = ['killed', 'injured', 'population']
+COLUMN_PREFIX = {
+    'killed': 'killed',
+    'injured': 'injured',
+    'population': 'popestimate',
+}
+FEATURES = ['Killed', 'Injured', 'Total']
+METRICS = ['Raw', 'Per 100,000']
+
+class StateCube:
+    '''
+    df_state as a dense int64 array indexed by (state, year, measure), so the
+    choropleth callbacks slice arrays instead of building column names and
+    doing a label lookup per number.
+
+    Every (feature, metric) the choropleth can show is worked out for all
+    states and years at once up front. `metrics` has a (state, year, feature)
+    array per metric and `values` the (state, year) slice of each
+    (feature, metric). Per 100,000 values aren't rounded, that's up to
+    whoever's showing them
+    '''
+    def __init__(self, df_state, years=range(2014, 2018)):
+        self.states = list(df_state.index)
+        self.index = {state: i for i, state in enumerate(self.states)}
+        self.years = list(years)
+        self.first_year = self.years[0]
+
+        self.cube = np.empty((len(self.states), len(self.years),
+                              len(MEASURES)), dtype=np.int64)
+        for m, measure in enumerate(MEASURES):
+            columns = [f'{COLUMN_PREFIX[measure]}{year}' for year in self.years]
+            # Population comes out of the csv as float, they're whole numbers
+            self.cube[:, :, m] = df_state[columns].to_numpy().round()
+
+        killed, injured, population = np.moveaxis(self.cube, -1, 0)
+        # (state, year, feature) for each metric, FEATURES order
+        self.metrics = {'Raw': np.stack([killed, injured, killed + injured],
+                                        axis=-1)}
+        self.metrics['Per 100,000'] = \
+            self.metrics['Raw'] / (population[..., None] / 100000)
+        # Slices get handed out to every request, nobody gets to write to them
+        self.cube.flags.writeable = False
+        for z in self.metrics.values():
+            z.flags.writeable = False
+        self.values = {(feature, metric): z[..., f]
+                       for metric, z in self.metrics.items()
+                       for f, feature in enumerate(FEATURES)}
+
+    def trend(self, state, feature, metric):
+        '''
+        Returns a state's feature/metric for every year, raises KeyError for
+        an unknown state
+        '''
+        return self.values[feature, metric][self.index[state]]
+
+    def year(self, year, feature, metric):
+        '''
+        Returns every state's feature/metric in a year, in self.states order
+        '''
+        return self.values[feature, metric][:, year - self.first_year]
+
+    def totals(self, state, year):
+        '''
+        Returns the (raw, per 100,000) arrays of Killed, Injured and Total
+        for a state in a year
+        '''
+        i, y = self.index[state], year - self.first_year
+        return (self.metrics['Raw'][i, y], self.metrics['Per 100,000'][i, y])